@@ -0,0 +1,9 @@
+"""
+Shared attendance pipeline used by the branch scripts.
+
+Each script (attendance_logs.py, essl_love_craft.py, double_punch_essl.py,
+script_start_end_time.py) only picks a checklog strategy; reading the device,
+deriving entries, state files and delivery to the API all live here.
+"""
+
+from . import startup
@@ -0,0 +1,177 @@
+"""
+Per-employee daily attendance aggregates, kept up to date at ingest time.
+
+Every classified punch updates its employee's aggregate for the work day it
+belongs to: first in, last out, worked seconds, late arrival and whether the
+day was left without a punch-out. Each work day is stored in its own file
+(daily_aggregates/YYYY-MM-DD.json in the state folder), so a cycle only loads
+and rewrites the days it touched. daily_aggregates/state.json holds every
+employee's open check-in and the summaries not yet accepted by SUMMARY_API_URL.
+Summaries have their own circuit breaker (summary_circuit_state.txt), so an
+unhealthy summary endpoint never pauses the delivery of raw punches.
+"""
+import os
+import json
+from datetime import datetime, timedelta
+
+from . import config
+from .delivery import CircuitBreaker, send_logs_to_api
+from .shifts import load_employee_shift_data, parse_shift_config
+from .state import TIME_FORMAT, write_file_atomic
+
+AGGREGATES_DIR = "daily_aggregates"
+AGGREGATES_STATE_FILE = "state.json"
+SUMMARY_BREAKER_STATE_FILE = "summary_circuit_state.txt"
+
+def new_aggregate():
+    return {"first_in": None, "last_out": None, "worked_seconds": 0, "late_seconds": None, "punches": 0, "missed_punch_out": False}
+
+class DailyAggregates:
+    """Running aggregates of one device's employees; `add` costs O(1) per punch."""
+
+    def __init__(self, state_dir=".", track_pending=True):
+        self.dir = os.path.join(state_dir, AGGREGATES_DIR)
+        self.track_pending = track_pending
+        self.days = {}
+        self.touched = set()
+        self.shifts = {}
+        self.shift_data = {}
+        try:
+            with open(os.path.join(self.dir, AGGREGATES_STATE_FILE), "r") as file:
+                state = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        # {employee_id: (work_date, check-in time)} for employees still checked in.
+        self.open = {
+            employee_id: (work_date, datetime.strptime(in_time, TIME_FORMAT))
+            for employee_id, (work_date, in_time) in state.get("open", {}).items()
+        }
+        self.pending = {tuple(key) for key in state.get("pending", [])} if track_pending else set()
+
+    def prepare(self, state_dir="."):
+        """Picks up the shift data cached by the shift-aware strategies, if any."""
+        self.shift_data = load_employee_shift_data(state_dir)
+        self.shifts = {}
+
+    def get_shift(self, employee_id):
+        if employee_id not in self.shifts:
+            shift_config = self.shift_data.get(employee_id)
+            self.shifts[employee_id] = parse_shift_config(shift_config) if shift_config else None
+        return self.shifts[employee_id]
+
+    def load_day(self, work_date):
+        day = self.days.get(work_date)
+        if day is None:
+            try:
+                with open(os.path.join(self.dir, f"{work_date}.json"), "r") as file:
+                    day = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                day = {}
+            self.days[work_date] = day
+        return day
+
+    def get(self, work_date, employee_id):
+        day = self.load_day(work_date)
+        aggregate = day.get(employee_id)
+        if aggregate is None:
+            aggregate = day[employee_id] = new_aggregate()
+        self.touched.add((work_date, employee_id))
+        return aggregate
+
+    def work_date(self, employee_id, log_time):
+        """Punches before the end of a shift spanning midnight belong to the previous day."""
+        shift = self.get_shift(employee_id)
+        if shift and shift[2] and log_time.time() <= shift[1]:
+            return str(log_time.date() - timedelta(days=1))
+        return str(log_time.date())
+
+    def add(self, employee_id, log_time, checklog):
+        """Folds one classified punch into its work day."""
+        opened = self.open.pop(employee_id, None)
+        if opened and log_time - opened[1] > timedelta(hours=config.MAX_SHIFT_HOURS):
+            self.get(opened[0], employee_id)["missed_punch_out"] = True
+            opened = None
+
+        if checklog == "in":
+            work_date = self.work_date(employee_id, log_time)
+            if opened and opened[0] != work_date:
+                self.get(opened[0], employee_id)["missed_punch_out"] = True
+            aggregate = self.get(work_date, employee_id)
+            if aggregate["first_in"] is None:
+                aggregate["first_in"] = log_time.strftime(TIME_FORMAT)
+                shift = self.get_shift(employee_id)
+                if shift:
+                    late = log_time - datetime.combine(datetime.strptime(work_date, "%Y-%m-%d"), shift[0])
+                    late_seconds = int(late.total_seconds()) - config.LATE_GRACE_MINUTES * 60
+                    aggregate["late_seconds"] = max(late_seconds, 0)
+            self.open[employee_id] = (work_date, log_time)
+        else:
+            work_date = opened[0] if opened else self.work_date(employee_id, log_time)
+            aggregate = self.get(work_date, employee_id)
+            if opened:
+                aggregate["worked_seconds"] += int((log_time - opened[1]).total_seconds())
+            aggregate["last_out"] = log_time.strftime(TIME_FORMAT)
+        aggregate["punches"] += 1
+
+    def expire_open(self, now):
+        """Flags check-ins left open for longer than MAX_SHIFT_HOURS as missed punch-outs."""
+        limit = now - timedelta(hours=config.MAX_SHIFT_HOURS)
+        for employee_id, (work_date, in_time) in list(self.open.items()):
+            if in_time < limit:
+                del self.open[employee_id]
+                self.get(work_date, employee_id)["missed_punch_out"] = True
+
+    def summary_records(self, settings, keys):
+        """Returns the API summary record of every (work_date, employee_id) in `keys`."""
+        records = []
+        for work_date, employee_id in sorted(keys):
+            aggregate = self.load_day(work_date).get(employee_id)
+            if aggregate is None:
+                continue
+            records.append({
+                "employee_id": employee_id,
+                "company_id": settings["company_id"],
+                "branch_id": settings["branch_id"],
+                "work_date": work_date,
+                "device_name": settings["device_name"],
+                **aggregate
+            })
+        return records
+
+    def save(self):
+        """Writes the touched days and the open check-ins, and drops days past AGGREGATE_RETENTION_DAYS."""
+        os.makedirs(self.dir, exist_ok=True)
+        for work_date in {work_date for work_date, _ in self.touched}:
+            write_file_atomic(os.path.join(self.dir, f"{work_date}.json"), json.dumps(self.days[work_date]))
+        oldest = str((datetime.now() - timedelta(days=config.AGGREGATE_RETENTION_DAYS)).date())
+        if self.track_pending:
+            self.pending = {key for key in self.pending | self.touched if key[0] >= oldest}
+        self.touched = set()
+        self.save_state()
+
+        for name in os.listdir(self.dir):
+            if name != AGGREGATES_STATE_FILE and name.endswith(".json") and name[:-5] < oldest:
+                os.remove(os.path.join(self.dir, name))
+
+    def save_state(self):
+        write_file_atomic(os.path.join(self.dir, AGGREGATES_STATE_FILE), json.dumps({
+            "open": {employee_id: [work_date, in_time.strftime(TIME_FORMAT)] for employee_id, (work_date, in_time) in self.open.items()},
+            "pending": sorted(self.pending)
+        }))
+
+def send_summaries(aggregates, settings):
+    """
+    Sends the summaries of every day changed since the last accepted send to
+    SUMMARY_API_URL. Unsent summaries stay pending for the next cycle.
+    """
+    summary_url = settings.get("summary_api_url")
+    if not summary_url or not aggregates.pending:
+        return True
+    records = aggregates.summary_records(settings, aggregates.pending)
+    breaker = CircuitBreaker(state_file=SUMMARY_BREAKER_STATE_FILE)
+    if not send_logs_to_api(records, summary_url, lane="catchup", breaker=breaker):
+        print(f"{len(records)} daily summaries were not sent, they will be retried next cycle.")
+        return False
+    aggregates.pending = set()
+    aggregates.save_state()
+    return True
@@ -0,0 +1,152 @@
+"""
+Local archive of raw device punches.
+
+Punches are appended to one JSON-lines file per day (archive/YYYY-MM-DD.jsonl),
+so the file names double as an index: reading a date range only opens the
+files for those days. archive/cursor.txt remembers the newest archived punch
+so every cycle only appends what is new, and how many records the device
+held then. The device appends punches in storage order whatever its clock
+says, so when more records were added than are newer than the cursor, the
+clock was set back and the added records are archived by position instead.
+"""
+import os
+import json
+from datetime import datetime, timedelta
+from operator import attrgetter
+from collections import namedtuple
+
+from .config import ARCHIVE_DIR
+from .state import TIME_FORMAT, write_file_atomic
+
+ARCHIVE_CURSOR_FILE = "cursor.txt"
+
+ArchivedLog = namedtuple("ArchivedLog", ["user_id", "timestamp", "status", "punch"])
+
+def load_archive_cursor(archive_dir=ARCHIVE_DIR):
+    """
+    Returns (last archived time, user ids archived at that exact time, number
+    of records the device held then or None when unknown).
+    """
+    try:
+        with open(os.path.join(archive_dir, ARCHIVE_CURSOR_FILE), "r") as file:
+            cursor = json.load(file)
+        return datetime.strptime(cursor["last_time"], TIME_FORMAT), set(cursor["user_ids"]), cursor.get("device_records")
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError):
+        return None, set(), None
+
+def save_archive_cursor(last_time, user_ids, device_records, archive_dir=ARCHIVE_DIR):
+    write_file_atomic(
+        os.path.join(archive_dir, ARCHIVE_CURSOR_FILE),
+        json.dumps({"last_time": last_time.strftime(TIME_FORMAT), "user_ids": sorted(user_ids), "device_records": device_records})
+    )
+
+def archive_logs(attendance_logs, archive_dir=ARCHIVE_DIR):
+    """
+    Appends punches newer than the archive cursor to their day files and fsyncs
+    them before moving the cursor. `attendance_logs` must be the whole device
+    log in the device's order. Returns the number of punches archived.
+    """
+    last_time, user_ids_at_last_time, device_records = load_archive_cursor(archive_dir)
+    new_logs = [
+        log for log in attendance_logs
+        if last_time is None or log.timestamp > last_time
+        or (log.timestamp == last_time and str(log.user_id) not in user_ids_at_last_time)
+    ]
+    if device_records is not None and len(attendance_logs) - device_records > len(new_logs):
+        # The device clock was set back: some of the records appended since
+        # the last read are older than the cursor.
+        print(f"{len(attendance_logs) - device_records - len(new_logs)} new punches are older than the archive cursor "
+              f"({last_time}); the device clock was set back. Archiving them by position.")
+        new_logs = attendance_logs[device_records:]
+    if not new_logs:
+        if last_time is not None and device_records != len(attendance_logs):
+            save_archive_cursor(last_time, user_ids_at_last_time, len(attendance_logs), archive_dir)
+        return 0
+    new_logs.sort(key=attrgetter("timestamp"))
+    os.makedirs(archive_dir, exist_ok=True)
+
+    file = None
+    file_day = None
+    try:
+        for log in new_logs:
+            day = log.timestamp.date()
+            if day != file_day:
+                if file:
+                    file.flush()
+                    os.fsync(file.fileno())
+                    file.close()
+                file = open(os.path.join(archive_dir, f"{day}.jsonl"), "a")
+                file_day = day
+            file.write(json.dumps([str(log.user_id), log.timestamp.strftime(TIME_FORMAT), log.status, log.punch]) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    finally:
+        if file:
+            file.close()
+
+    newest = new_logs[-1].timestamp
+    if last_time is not None and newest < last_time:
+        # Keep the cursor where it was, so the punches archived before the reset are not appended again.
+        save_archive_cursor(last_time, user_ids_at_last_time, len(attendance_logs), archive_dir)
+        return len(new_logs)
+    user_ids = {str(log.user_id) for log in new_logs if log.timestamp == newest}
+    if newest == last_time:
+        user_ids |= user_ids_at_last_time
+    save_archive_cursor(newest, user_ids, len(attendance_logs), archive_dir)
+    return len(new_logs)
+
+def archived_days(archive_dir=ARCHIVE_DIR):
+    """Returns the sorted list of days that have an archive file."""
+    try:
+        names = os.listdir(archive_dir)
+    except FileNotFoundError:
+        return []
+    days = []
+    for name in names:
+        if name.endswith(".jsonl"):
+            try:
+                days.append(datetime.strptime(name[:-6], "%Y-%m-%d").date())
+            except ValueError:
+                continue
+    return sorted(days)
+
+def archive_covers(start, end, archive_dir=ARCHIVE_DIR):
+    """True when the archive holds every punch between `start` and `end`."""
+    days = archived_days(archive_dir)
+    last_time, _, _ = load_archive_cursor(archive_dir)
+    return bool(days) and days[0] <= start.date() and last_time is not None and last_time >= end
+
+def iter_archived_logs(start, end, archive_dir=ARCHIVE_DIR):
+    """
+    Yields archived punches between `start` and `end` day by day, opening only
+    the files for those days. Within a day they come in time order unless the
+    device clock was set back.
+    """
+    day = start.date()
+    while day <= end.date():
+        try:
+            with open(os.path.join(archive_dir, f"{day}.jsonl"), "r") as file:
+                for line in file:
+                    user_id, log_time, status, punch = json.loads(line)
+                    timestamp = datetime.strptime(log_time, TIME_FORMAT)
+                    if start <= timestamp <= end:
+                        yield ArchivedLog(user_id, timestamp, status, punch)
+        except FileNotFoundError:
+            pass
+        day += timedelta(days=1)
+
+def iter_archived_days(start_day, end_day, archive_dir=ARCHIVE_DIR):
+    """
+    Yields (day, rows) for every day from `start_day` to `end_day`, where rows
+    are the raw [user_id, "yyyy-mm-dd HH:MM:SS", status, punch] lists of that
+    day's file. Only one day is held in memory at a time.
+    """
+    day = start_day
+    while day <= end_day:
+        try:
+            with open(os.path.join(archive_dir, f"{day}.jsonl"), "r") as file:
+                rows = [json.loads(line) for line in file]
+        except FileNotFoundError:
+            rows = []
+        yield day, rows
+        day += timedelta(days=1)
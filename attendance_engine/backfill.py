@@ -0,0 +1,129 @@
+"""
+Bounded-window backfill.
+
+Re-sends the punches between two moments without touching the live state
+files: all state for a run lives in its own scratch folder
+(backfill_state/<start>-<end> by default), so an interrupted run can be
+started again and continues after the last batch that was accepted. Progress
+is the (check_date, check_time, employee_id) key of the last entry sent, not
+a count, so a rerun whose entries come out differently (fresh shift data or
+punch-code stats) still resumes at the right punch.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from operator import attrgetter
+
+from . import config
+from .archive import archive_logs, archive_covers, iter_archived_logs
+from .config import get_settings
+from .delivery import send_logs_to_api
+from .engine import derive_log_entries, read_device_logs
+from .roster import load_employee_map
+from .state import load_last_logs, save_last_logs, write_file_atomic
+from .strategies import STRATEGIES, BoundedWindowStrategy
+
+BACKFILL_CHUNK_SIZE = 2000 # Entries handed to the sender at a time; progress is saved after each chunk.
+BACKFILL_PROGRESS_FILE = "backfill_progress.txt"
+
+def parse_moment(value, end_of_day=False):
+    """Parses "yyyy-mm-dd", "yyyy-mm-dd HH:MM" or "yyyy-mm-dd HH:MM:SS"."""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    day = datetime.strptime(value, "%Y-%m-%d")
+    return day + timedelta(days=1, microseconds=-1) if end_of_day else day
+
+def read_window_from_device(settings, start, end, state_dir="."):
+    """Reads the device once and slices out the window with a binary search on the sorted records."""
+    attendance_logs = read_device_logs(settings, state_dir)
+    if config.ARCHIVE_LOGS:
+        archive_logs(attendance_logs, settings["archive_dir"])
+    attendance_logs.sort(key=attrgetter("timestamp"))
+    first = bisect_left(attendance_logs, start, key=attrgetter("timestamp"))
+    last = bisect_right(attendance_logs, end, key=attrgetter("timestamp"))
+    return attendance_logs[first:last]
+
+def entry_key(entry):
+    return entry["check_date"], entry["check_time"], str(entry["employee_id"])
+
+def load_backfill_progress(state_dir):
+    """Returns the key of the last entry an earlier run of this backfill sent, or None."""
+    try:
+        with open(os.path.join(state_dir, BACKFILL_PROGRESS_FILE), "r") as file:
+            return tuple(json.load(file))
+    except (FileNotFoundError, ValueError, TypeError):
+        return None
+
+def backfill(start, end, strategy, source="auto", state_dir=None, dry_run=False):
+    settings = get_settings(start)
+    state_dir = state_dir or os.path.join("backfill_state", f"{start:%Y%m%d%H%M%S}-{end:%Y%m%d%H%M%S}")
+    os.makedirs(state_dir, exist_ok=True)
+
+    read_started = time.perf_counter()
+    archive_dir = settings["archive_dir"]
+    if source == "archive" or (source == "auto" and archive_covers(start, end, archive_dir)):
+        origin = "archive"
+        window_logs = list(iter_archived_logs(start, end, archive_dir))
+    else:
+        origin = "device"
+        window_logs = read_window_from_device(settings, start, end, state_dir)
+    read_seconds = time.perf_counter() - read_started
+    print(f"Read {len(window_logs)} punches between {start} and {end} from the {origin} in {read_seconds:.1f} seconds.")
+
+    last_logs = load_last_logs(state_dir)
+    window_strategy = BoundedWindowStrategy(strategy, start, end)
+    window_strategy.prepare(settings, state_dir)
+    employee_ids = load_employee_map(settings["employee_map_file"])
+    entries = derive_log_entries(window_logs, start, last_logs, window_strategy, settings, employee_ids=employee_ids)
+    entries.sort(key=entry_key)
+    total = len(entries)
+    sent = 0
+    last_sent = load_backfill_progress(state_dir)
+    if last_sent:
+        sent = bisect_right(entries, last_sent, key=entry_key)
+        print(f"Resuming after {last_sent[0]} {last_sent[1]} (employee {last_sent[2]}), sent by an earlier run; {sent} entries skipped.")
+    if dry_run:
+        print(f"Dry run: {total - sent} entries would be sent. Scratch state: {state_dir}")
+        return total - sent
+
+    send_started = time.perf_counter()
+    sent_this_run = 0
+    for i in range(sent, total, BACKFILL_CHUNK_SIZE):
+        chunk = entries[i:i + BACKFILL_CHUNK_SIZE]
+        if not send_logs_to_api(chunk, settings["api_url"], lane="backfill"):
+            print(f"Backfill stopped at {sent}/{total} entries; run the same command again to resume.")
+            return sent_this_run
+        sent = i + len(chunk)
+        sent_this_run += len(chunk)
+        write_file_atomic(os.path.join(state_dir, BACKFILL_PROGRESS_FILE), json.dumps(entry_key(chunk[-1])))
+        elapsed = time.perf_counter() - send_started
+        print(f"Sent {sent}/{total} entries ({sent_this_run / elapsed if elapsed else 0:.0f} entries/s).")
+
+    save_last_logs(last_logs, state_dir)
+    window_strategy.save(state_dir)
+    print(f"Backfill finished: {total} entries between {start} and {end}. Scratch state: {state_dir}")
+    return sent_this_run
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send the punches between two moments without touching the live state files.")
+    parser.add_argument("--start", required=True, help='Window start: "yyyy-mm-dd" or "yyyy-mm-dd HH:MM[:SS]".')
+    parser.add_argument("--end", required=True, help='Window end: "yyyy-mm-dd" (whole day) or "yyyy-mm-dd HH:MM[:SS]".')
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="toggle", help="Checklog strategy to apply.")
+    parser.add_argument("--source", choices=["auto", "archive", "device"], default="auto",
+                        help="Read from the local archive or the device (auto uses the archive when it covers the window).")
+    parser.add_argument("--state-dir", help="Scratch state folder (defaults to backfill_state/<start>-<end>).")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many entries would be sent.")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    start = parse_moment(args.start)
+    end = parse_moment(args.end, end_of_day=True)
+    if end < start:
+        parser.error("--end must not be before --start")
+    backfill(start, end, STRATEGIES[args.strategy](), args.source, args.state_dir, args.dry_run)
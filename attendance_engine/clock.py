@@ -0,0 +1,113 @@
+"""
+Device clock skew tracking and timestamp normalization.
+
+Each session reads the device clock (conn.get_time(), bracketed by the host
+clock) and keeps the measured skew in device_clock.json in the state folder.
+A least-squares fit over the samples since the last jump gives the drift, and
+a jump larger than CLOCK_JUMP_SECONDS (a clock reset) starts a new fit.
+
+Punch timestamps are device-local wall times. `normalize` turns a whole batch
+into naive UTC on the host's timeline: the device's UTC offset (DEVICE_TZ,
+the host's zone by default) plus the skew is looked up once per hour of punch
+time and cached, so the pass costs one dict lookup and one subtraction per
+record. The poller filters against last_processed_time and sorts on these
+values, so a device running behind no longer hides punches behind the host's
+watermark. The entries sent to the API keep the device's own times.
+"""
+import os
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from . import config
+from .startup import lazy_import
+from .state import write_file_atomic
+
+DEVICE_CLOCK_FILE = "device_clock.json"
+CLOCK_MAX_SAMPLES = 50
+
+def host_to_utc(local_time):
+    """Converts a naive host-local time to naive UTC."""
+    return local_time.astimezone(timezone.utc).replace(tzinfo=None)
+
+class DeviceClock:
+    def __init__(self, settings, state_dir="."):
+        self.path = os.path.join(state_dir, DEVICE_CLOCK_FILE)
+        self.device_name = settings["device_name"]
+        tz_name = settings.get("device_tz")
+        self.tz = lazy_import("pytz").timezone(tz_name) if tz_name else None
+        try:
+            with open(self.path, "r") as file:
+                self.samples = json.load(file)["samples"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            self.samples = []
+        self.skew = self.predict(time.time())
+        self.offsets = {}
+
+    def device_to_utc_offset(self, local_time):
+        """UTC offset of the device's zone at a device-local time."""
+        if self.tz is None:
+            return local_time.astimezone().utcoffset()
+        return self.tz.utcoffset(local_time, is_dst=False)
+
+    def drift(self):
+        """Seconds the device gains per day, from the samples since the last jump (0 with fewer than two)."""
+        if len(self.samples) < 2:
+            return 0.0
+        mean_t = sum(sample[0] for sample in self.samples) / len(self.samples)
+        mean_s = sum(sample[1] for sample in self.samples) / len(self.samples)
+        spread = sum((sample[0] - mean_t) ** 2 for sample in self.samples)
+        if not spread:
+            return 0.0
+        slope = sum((sample[0] - mean_t) * (sample[1] - mean_s) for sample in self.samples) / spread
+        return slope * 86400
+
+    def predict(self, at):
+        """Expected skew in seconds at host epoch time `at`, or 0 without samples."""
+        if not self.samples:
+            return 0.0
+        last_at, last_skew = self.samples[-1][:2]
+        return last_skew + self.drift() * (at - last_at) / 86400
+
+    def measure(self, conn):
+        """Reads the device clock and records the skew (device minus host, in seconds)."""
+        try:
+            before = time.time()
+            device_time = conn.get_time()
+            after = time.time()
+        except Exception as e:
+            print(f"Could not read the clock of {self.device_name} ({e}); using the estimated skew of {self.skew:.0f} s.")
+            return self.skew
+
+        host_time = (before + after) / 2
+        device_utc = device_time - self.device_to_utc_offset(device_time)
+        skew = (device_utc - datetime(1970, 1, 1)).total_seconds() - host_time
+        if self.samples and abs(skew - self.predict(host_time)) > config.CLOCK_JUMP_SECONDS:
+            print(f"Clock of {self.device_name} jumped by {skew - self.predict(host_time):.0f} s since the last session.")
+            self.samples = []
+        self.samples = (self.samples + [[round(host_time, 3), round(skew, 3), round(after - before, 3)]])[-CLOCK_MAX_SAMPLES:]
+        self.skew = skew
+        self.offsets = {}
+        if abs(skew) > config.CLOCK_SKEW_TOLERANCE:
+            print(f"Clock of {self.device_name} is {abs(skew):.0f} s {'ahead' if skew > 0 else 'behind'} "
+                  f"(drift {self.drift():+.1f} s/day); punch times are corrected for comparisons.")
+        write_file_atomic(self.path, json.dumps({"samples": self.samples, "drift_per_day": round(self.drift(), 3)}))
+        return skew
+
+    def normalize(self, attendance_logs):
+        """
+        Returns the naive UTC host-timeline time of every punch, in input order.
+        Skews within CLOCK_SKEW_TOLERANCE seconds count as none.
+        """
+        skew = timedelta(seconds=self.skew) if abs(self.skew) > config.CLOCK_SKEW_TOLERANCE else timedelta(0)
+        offsets = self.offsets
+        normalized = []
+        append = normalized.append
+        for log in attendance_logs:
+            timestamp = log.timestamp
+            hour = (timestamp.toordinal(), timestamp.hour)
+            delta = offsets.get(hour)
+            if delta is None:
+                delta = offsets[hour] = self.device_to_utc_offset(timestamp) + skew
+            append(timestamp - delta)
+        return normalized
@@ -0,0 +1,160 @@
+"""
+Settings read from the environment (and the .env file next to the scripts).
+
+Other modules read these values as config.X at the time of use, so
+`reload_env` can change them while a poller keeps running.
+"""
+import os
+import sys
+import json
+import importlib
+from datetime import datetime
+from dotenv import load_dotenv, find_dotenv, dotenv_values
+
+ENV_FILE = globals().get("ENV_FILE") or find_dotenv()
+# Variables already set when the process started win over .env, also after a reload.
+PROCESS_ENV = globals().get("PROCESS_ENV") or frozenset(os.environ)
+ENV_VALUES = dotenv_values(ENV_FILE) if ENV_FILE else {}
+load_dotenv(ENV_FILE)
+
+API_BATCH_SIZE = int(os.getenv('API_BATCH_SIZE', 500)) # Maximum number of entries per request.
+API_CONCURRENCY = int(os.getenv('API_CONCURRENCY', 4)) # Number of batches allowed in flight at once.
+API_TIMEOUT = int(os.getenv('API_TIMEOUT', 60)) # Seconds allowed for a single request.
+
+LIVE_WINDOW_SECONDS = int(os.getenv('LIVE_WINDOW_SECONDS', 5 * 60)) # Punches younger than this travel in the live lane.
+# Relative share of batches each delivery lane gets while several lanes have work.
+LANE_WEIGHTS = {
+    "live": int(os.getenv('LIVE_LANE_WEIGHT', 6)),
+    "catchup": int(os.getenv('CATCHUP_LANE_WEIGHT', 3)),
+    "backfill": int(os.getenv('BACKFILL_LANE_WEIGHT', 1))
+}
+# Entries per second each lane may send (0 = unlimited).
+LANE_RATE_LIMITS = {
+    "live": int(os.getenv('LIVE_LANE_RATE_LIMIT', 0)),
+    "catchup": int(os.getenv('CATCHUP_LANE_RATE_LIMIT', 0)),
+    "backfill": int(os.getenv('BACKFILL_LANE_RATE_LIMIT', 2000))
+}
+
+# Number of retries allowed per error class before a batch is given up for this cycle.
+RETRY_LIMITS = {
+    "timeout": int(os.getenv('RETRY_TIMEOUT_ATTEMPTS', 3)),
+    "server_error": int(os.getenv('RETRY_SERVER_ERROR_ATTEMPTS', 4)),
+    "connection": int(os.getenv('RETRY_CONNECTION_ATTEMPTS', 5)),
+    "rate_limited": int(os.getenv('RETRY_RATE_LIMITED_ATTEMPTS', 10))
+}
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 1)) # Seconds before the first retry.
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 30)) # Upper bound for a single backoff.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 3)) # Failed batches in a row before the breaker opens.
+BREAKER_COOLDOWN = int(os.getenv('BREAKER_COOLDOWN', 5 * 60)) # Seconds the breaker stays open before probing the API again.
+
+DEVICE_TIMEOUT = int(os.getenv('DEVICE_TIMEOUT', 15)) # Seconds the device may take to answer one request (connect or chunk).
+DEVICE_READ_DEADLINE = int(os.getenv('DEVICE_READ_DEADLINE', 3 * 60)) # Seconds allowed for a whole device read; the rest resumes next cycle.
+
+CLOCK_SKEW_TOLERANCE = float(os.getenv('CLOCK_SKEW_TOLERANCE', 2)) # Device clock skew (seconds) treated as none.
+CLOCK_JUMP_SECONDS = float(os.getenv('CLOCK_JUMP_SECONDS', 5 * 60)) # Skew change between sessions treated as a clock reset.
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive') # Folder holding the local archive of raw device punches.
+ARCHIVE_LOGS = os.getenv('ARCHIVE_LOGS', '1') == '1' # Set to 0 to stop archiving punches every cycle.
+
+DEVICES_FILE = os.getenv('DEVICES_FILE', 'devices.json') # Optional list of devices polled by this process.
+LEASE_SECONDS = int(os.getenv('LEASE_SECONDS', 6 * 60)) # A device lease not renewed within this time can be claimed by another node.
+
+LATE_GRACE_MINUTES = int(os.getenv('LATE_GRACE_MINUTES', 0)) # Minutes after shift start before a first check-in counts as late.
+MAX_SHIFT_HOURS = int(os.getenv('MAX_SHIFT_HOURS', 16)) # A check-in without a check-out within this time is a missed punch-out.
+AGGREGATE_RETENTION_DAYS = int(os.getenv('AGGREGATE_RETENTION_DAYS', 62)) # Days of daily aggregates kept in the state folder.
+
+PRESENCE_PORT = int(os.getenv('PRESENCE_PORT', 0)) # Port of the local presence endpoint (0 = not served).
+PRESENCE_HOST = os.getenv('PRESENCE_HOST', '127.0.0.1')
+
+ROSTER_MAX_AGE_HOURS = int(os.getenv('ROSTER_MAX_AGE_HOURS', 24)) # The device user table is downloaded again at least this often.
+
+PROFILE_CYCLES = int(os.getenv('PROFILE_CYCLES', 0)) # Cycles to profile right after start-up.
+PROFILE_SIGNAL_CYCLES = int(os.getenv('PROFILE_SIGNAL_CYCLES', 3)) # Cycles profiled after each SIGUSR1.
+PROFILE_CONTROL_FILE = os.getenv('PROFILE_CONTROL_FILE', 'profile_cycles.txt') # Write a number of cycles here to profile them.
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_TOP_ALLOCATIONS = int(os.getenv('PROFILE_TOP_ALLOCATIONS', 25)) # Lines listed per stage allocation report.
+PROFILE_TRACE_FRAMES = int(os.getenv('PROFILE_TRACE_FRAMES', 1)) # Frames tracemalloc keeps per allocation.
+
+CYCLE_INTERVAL = int(os.getenv('CYCLE_INTERVAL', 2 * 60)) # Seconds between two polling cycles.
+
+def get_settings(default_start_date):
+    """
+    Returns the device and API settings for one polling run.
+    START_DATE (yyyy-mm-dd) overrides the script's default first day to process.
+    DEBOUNCE_SECONDS and PUNCH_CODE_MODE (auto, trust or ignore) tune how this
+    device's punches are classified, and EMPLOYEE_MAP_FILE maps its user ids
+    to HRMS employee ids.
+    """
+    start_date = os.getenv('START_DATE')
+    return {
+        "device_ip": os.getenv('DEVICE_IP'),
+        "device_port": int(os.getenv('DEVICE_PORT', 4370)),
+        "device_name": os.getenv('DEVICE_NAME', 'Primary'),
+        "device_tz": os.getenv('DEVICE_TZ'),
+        "branch_id": os.getenv('BRANCH_ID'),
+        "company_id": os.getenv('COMPANY_ID'),
+        "api_url": os.getenv('API_URL'),
+        "relay_url": os.getenv('RELAY_URL'),
+        "summary_api_url": os.getenv('SUMMARY_API_URL'),
+        "employee_map_file": os.getenv('EMPLOYEE_MAP_FILE', 'employee_map.csv'),
+        "debounce_seconds": int(os.getenv('DEBOUNCE_SECONDS', 30)),
+        "punch_code_mode": os.getenv('PUNCH_CODE_MODE', 'auto'),
+        "archive_dir": ARCHIVE_DIR,
+        "start_date": datetime.strptime(start_date, "%Y-%m-%d") if start_date else default_start_date
+    }
+
+def device_key(settings):
+    """Identifies a device across nodes and state folders."""
+    return f"{settings['device_ip']}:{settings['device_port']}"
+
+def device_state_dir(settings, state_root="state"):
+    """State folder a poller node keeps a device's cursor and employee state in."""
+    return os.path.join(state_root, device_key(settings).replace(":", "_"))
+
+def find_device(device, default_start_date=None):
+    """
+    Returns the settings of the DEVICES_FILE entry whose key (ip:port), IP or
+    device name is `device`, or None when no device matches.
+    """
+    for settings in load_devices(default_start_date):
+        if device in (device_key(settings), settings["device_ip"], settings["device_name"]):
+            return settings
+    return None
+
+def load_devices(default_start_date, devices_file=None):
+    """
+    Returns the settings of every device in DEVICES_FILE, each entry overriding
+    the .env defaults (device_ip, device_port, device_name, branch_id, strategy,
+    debounce_seconds, ...). Without that file, the single .env device is returned.
+    Every device listed in the file gets its own archive folder.
+    """
+    base = get_settings(default_start_date)
+    try:
+        with open(devices_file or DEVICES_FILE, "r") as file:
+            entries = json.load(file)
+    except FileNotFoundError:
+        return [base]
+
+    devices = []
+    for entry in entries:
+        settings = {**base, **entry}
+        if isinstance(settings["start_date"], str):
+            settings["start_date"] = datetime.strptime(settings["start_date"], "%Y-%m-%d")
+        if "archive_dir" not in entry:
+            settings["archive_dir"] = os.path.join(ARCHIVE_DIR, device_key(settings).replace(":", "_"))
+        devices.append(settings)
+    return devices
+
+def reload_env():
+    """
+    Re-reads .env and recomputes every setting of this module in place.
+    Variables removed from .env are unset unless the process environment set them.
+    """
+    values = dotenv_values(ENV_FILE) if ENV_FILE else {}
+    for key in ENV_VALUES.keys() - values.keys():
+        if key not in PROCESS_ENV:
+            os.environ.pop(key, None)
+    for key, value in values.items():
+        if key not in PROCESS_ENV and value is not None:
+            os.environ[key] = value
+    importlib.reload(sys.modules[__name__])
@@ -0,0 +1,383 @@
+"""
+Delivery of log entries to the ingest API: batching, priority lanes, retries
+and the circuit breaker.
+
+Every entry travels in one of three lanes: "live" (punched within the last
+LIVE_WINDOW_SECONDS), "catchup" (older punches found by the poller) and
+"backfill" (sent by the backfill and reconcile commands). Batches are picked
+by weighted round robin across the lanes that have work, each lane limited
+to its own entries-per-second rate, so live punches are never queued behind
+bulk traffic. All entries of one employee travel in the lane of their oldest
+entry, split into streams by employee; a stream has at most one batch in
+flight, which keeps each employee's order.
+"""
+import json
+import time
+import zlib
+import random
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+
+from . import config
+from .profiling import stage
+from .startup import lazy_import
+
+BREAKER_STATE_FILE = "api_circuit_state.txt"
+LANES = ("live", "catchup", "backfill")
+
+def parse_retry_after(value, default=5):
+    """Returns the number of seconds to wait from a Retry-After header (seconds or HTTP date)."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+def split_into_streams(logs, stream_count):
+    """
+    Splits logs into streams by employee so every employee's entries stay in one
+    stream, in their original order.
+    """
+    streams = [[] for _ in range(stream_count)]
+    for log in logs:
+        streams[zlib.crc32(str(log["employee_id"]).encode()) % stream_count].append(log)
+    return [stream for stream in streams if stream]
+
+def assign_lanes(logs, lane=None):
+    """
+    Returns {lane: logs}. Without an explicit lane, employees whose entries were
+    all punched within LIVE_WINDOW_SECONDS go to "live" and the others to
+    "catchup": an employee's entries share the lane of their oldest one, so a
+    live punch is never posted before the same employee's older punches.
+    """
+    if lane:
+        return {lane: logs}
+    live_since = (datetime.now() - timedelta(seconds=config.LIVE_WINDOW_SECONDS)).strftime("%Y-%m-%d %H:%M:%S")
+    behind = {log["employee_id"] for log in logs if f"{log['check_date']} {log['check_time']}" < live_since}
+    lanes = {"live": [], "catchup": []}
+    for log in logs:
+        lanes["catchup" if log["employee_id"] in behind else "live"].append(log)
+    return {name: lane_logs for name, lane_logs in lanes.items() if lane_logs}
+
+class TokenBucket:
+    """Entries-per-second limit for one lane; a rate of 0 means unlimited."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until the lane may send again (a large batch can overdraw the bucket)."""
+        if not self.rate:
+            return 0.0
+        self.refill()
+        return 0.0 if self.tokens > 0 else -self.tokens / self.rate
+
+    def take(self, count):
+        if self.rate:
+            self.refill()
+            self.tokens -= count
+
+_lane_buckets = {}
+
+def lane_buckets():
+    """Returns the process-wide rate limiter of each lane, so limits hold across send calls."""
+    for lane in LANES:
+        rate = config.LANE_RATE_LIMITS[lane]
+        if lane not in _lane_buckets or _lane_buckets[lane].rate != rate:
+            _lane_buckets[lane] = TokenBucket(rate)
+    return _lane_buckets
+
+class LaneScheduler:
+    """
+    Picks the next item to send across the priority lanes. Items are queued per
+    (lane, stream key); a stream is busy while one of its items is in flight.
+    Callers serialize access with their own lock or condition.
+    """
+
+    def __init__(self, size_of=len):
+        self.size_of = size_of
+        self.streams = {lane: {} for lane in LANES}
+        self.busy = set()
+        self.credit = dict.fromkeys(LANES, 0)
+        self.buckets = lane_buckets()
+
+    def add(self, lane, key, items):
+        self.streams[lane].setdefault(key, deque()).extend(items)
+
+    def pending(self):
+        return bool(self.busy) or any(queue for streams in self.streams.values() for queue in streams.values())
+
+    def free_stream(self, lane):
+        for key, queue in self.streams[lane].items():
+            if queue and (lane, key) not in self.busy:
+                return key
+        return None
+
+    def next_item(self):
+        """Returns (lane, key, item) by smooth weighted round robin, or None if nothing may be sent now."""
+        ready = {}
+        for lane in LANES:
+            key = self.free_stream(lane)
+            if key is not None and self.buckets[lane].wait_time() == 0:
+                ready[lane] = key
+        if not ready:
+            return None
+        total = 0
+        for lane in ready:
+            self.credit[lane] += config.LANE_WEIGHTS[lane]
+            total += config.LANE_WEIGHTS[lane]
+        lane = max(ready, key=self.credit.get)
+        self.credit[lane] -= total
+
+        key = ready[lane]
+        item = self.streams[lane][key].popleft()
+        self.busy.add((lane, key))
+        self.buckets[lane].take(self.size_of(item))
+        return lane, key, item
+
+    def finish(self, lane, key, ok=True):
+        """Frees a stream after its item was sent; a failed item drops the rest of its stream to keep order."""
+        self.busy.discard((lane, key))
+        if not ok:
+            self.streams[lane][key].clear()
+        if not self.streams[lane][key]:
+            del self.streams[lane][key]
+
+    def retry_in(self):
+        """Seconds until a rate-limited lane with free work may send again, or None to wait for a finished item."""
+        waits = [self.buckets[lane].wait_time() for lane in LANES if self.free_stream(lane) is not None]
+        return min(waits) if waits else None
+
+class ApiThrottle:
+    """Shared pause used by all lanes when the API answers 429 Too Many Requests."""
+
+    def __init__(self):
+        self.resume_at = 0.0
+
+    def pause(self, seconds):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    async def wait(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class CircuitBreaker:
+    """
+    Tracks API health across cycles and stores it in api_circuit_state.txt so
+    operators can see when sending is paused.
+
+    closed    -> batches are sent normally.
+    open      -> nothing is sent until the cooldown has passed.
+    half_open -> traffic resumes with one batch in flight, doubling after each
+                 healthy cycle until the full concurrency is reached and the breaker closes.
+    """
+
+    def __init__(self, state_file=BREAKER_STATE_FILE):
+        self.state_file = state_file
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.concurrency = config.API_CONCURRENCY
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.state_file, "r") as file:
+                data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.state = data.get("state", "closed")
+        self.consecutive_failures = data.get("consecutive_failures", 0)
+        self.opened_at = data.get("opened_at")
+        self.concurrency = min(data.get("concurrency", config.API_CONCURRENCY), config.API_CONCURRENCY)
+
+    def save(self):
+        with open(self.state_file, "w") as file:
+            json.dump({
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened_at": self.opened_at,
+                "reopen_at": self.opened_at + config.BREAKER_COOLDOWN if self.state == "open" else None,
+                "concurrency": self.concurrency,
+                "updated_at": time.time()
+            }, file)
+
+    def allow_request(self):
+        """Returns True when batches may be sent, moving an expired open breaker to half_open."""
+        if self.state == "open":
+            if time.time() - self.opened_at < config.BREAKER_COOLDOWN:
+                return False
+            self.state = "half_open"
+            self.concurrency = 1
+            print("Circuit breaker half-open: probing the API with 1 batch in flight.")
+            self.save()
+        return True
+
+    def is_open(self):
+        return self.state == "open"
+
+    def record_success(self):
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= config.BREAKER_FAILURE_THRESHOLD:
+            self.state = "open"
+            self.opened_at = time.time()
+            print(f"Circuit breaker open: API unhealthy, pausing sends for {config.BREAKER_COOLDOWN} seconds.")
+        self.save()
+
+    def finish_cycle(self, healthy):
+        """Widens traffic after a healthy half-open cycle and closes the breaker at full concurrency."""
+        if healthy and self.state == "half_open":
+            self.concurrency = min(self.concurrency * 2, config.API_CONCURRENCY)
+            if self.concurrency >= config.API_CONCURRENCY:
+                self.state = "closed"
+                print("Circuit breaker closed: API healthy again.")
+            else:
+                print(f"Circuit breaker half-open: raising to {self.concurrency} batches in flight.")
+        self.save()
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(config.RETRY_MAX_DELAY, config.RETRY_BASE_DELAY * 2 ** attempt))
+
+async def post_batch(session, api_url, batch, throttle, breaker, lane):
+    """
+    Posts a single batch, waiting out 429 responses and retrying timeouts, 5xx
+    responses and dropped connections, each up to its RETRY_LIMITS budget.
+    Returns True if the API accepted the batch or already had its entries.
+    """
+    aiohttp = lazy_import("aiohttp")
+    with stage("serialize"):
+        body = json.dumps(batch).encode()
+    headers = {"Content-Type": "application/json", "X-Delivery-Lane": lane}
+    attempts = {}
+    while True:
+        await throttle.wait()
+        if breaker.is_open():
+            return False
+        try:
+            async with session.post(api_url, data=body, headers=headers) as response:
+                if response.status == 429:
+                    attempts["rate_limited"] = attempts.get("rate_limited", 0) + 1
+                    if attempts["rate_limited"] > config.RETRY_LIMITS["rate_limited"]:
+                        print(f"Giving up on batch after {attempts['rate_limited']} rate limit responses.")
+                        breaker.record_failure()
+                        return False
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    print(f"API rate limit reached, pausing for {retry_after:.0f} seconds.")
+                    throttle.pause(retry_after)
+                    continue
+                if response.status == 200:
+                    breaker.record_success()
+                    api_response = await response.json(content_type=None)
+                    if not api_response.get("success"):
+                        # Stored by an earlier attempt (e.g. one that timed out after the API saved it).
+                        print("API response: Duplicate or existing logs, counting the batch as delivered.")
+                    return True
+                if response.status < 500:
+                    print("Failed to send logs:", await response.text())
+                    return False
+                error_class = "server_error"
+                error = f"HTTP {response.status}"
+        except asyncio.TimeoutError:
+            error_class = "timeout"
+            error = "request timed out"
+        except aiohttp.ClientConnectionError as e:
+            error_class = "connection"
+            error = e
+
+        attempts[error_class] = attempts.get(error_class, 0) + 1
+        if attempts[error_class] > config.RETRY_LIMITS[error_class]:
+            print(f"Giving up on batch after {attempts[error_class]} {error_class} errors: {error}")
+            breaker.record_failure()
+            return False
+        delay = backoff_delay(sum(attempts.values()))
+        print(f"Send failed ({error}), retrying in {delay:.1f} seconds.")
+        await asyncio.sleep(delay)
+
+async def send_logs_to_api_async(logs, api_url, concurrency=None, breaker=None, lane=None):
+    """
+    Sends log entries to the API with up to `concurrency` batches in flight,
+    scheduled across the priority lanes (see the module docstring). `lane`
+    forces every entry into one lane. Nothing is sent while the circuit breaker is open.
+    """
+    breaker = breaker or CircuitBreaker()
+    if not breaker.allow_request():
+        print("Circuit breaker open: skipping send, logs will be retried next cycle.")
+        return False
+    aiohttp = lazy_import("aiohttp")
+    concurrency = min(concurrency or config.API_CONCURRENCY, breaker.concurrency)
+
+    scheduler = LaneScheduler()
+    batch_size = config.API_BATCH_SIZE
+    for lane_name, lane_logs in assign_lanes(logs, lane).items():
+        for index, stream in enumerate(split_into_streams(lane_logs, concurrency)):
+            scheduler.add(lane_name, index, [stream[i:i + batch_size] for i in range(0, len(stream), batch_size)])
+
+    throttle = ApiThrottle()
+    condition = asyncio.Condition()
+    results = []
+
+    async def worker(session):
+        while True:
+            async with condition:
+                while True:
+                    picked = scheduler.next_item()
+                    if picked or not scheduler.pending():
+                        break
+                    try:
+                        await asyncio.wait_for(condition.wait(), scheduler.retry_in())
+                    except asyncio.TimeoutError:
+                        pass
+            if picked is None:
+                return
+            lane_name, key, batch = picked
+            ok = await post_batch(session, api_url, batch, throttle, breaker, lane_name)
+            results.append(ok)
+            async with condition:
+                scheduler.finish(lane_name, key, ok)
+                condition.notify_all()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=config.API_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    breaker.finish_cycle(healthy=not breaker.is_open() and breaker.consecutive_failures == 0)
+    return all(results)
+
+def delivery_url(settings):
+    """Branch agents send to the relay when RELAY_URL is set, otherwise straight to the API."""
+    return settings.get("relay_url") or settings["api_url"]
+
+def send_logs_to_api(logs, api_url, lane=None, breaker=None):
+    """
+    Sends log entries to the API, in the given lane or split into live and
+    catch-up. `breaker` defaults to the raw punch breaker (api_circuit_state.txt).
+    """
+    for log in logs:
+        if "createdAt" in log and isinstance(log["createdAt"], datetime):
+            log["createdAt"] = log["createdAt"].isoformat()
+        if "updatedAt" in log and isinstance(log["updatedAt"], datetime):
+            log["updatedAt"] = log["updatedAt"].isoformat()
+    if asyncio.run(send_logs_to_api_async(logs, api_url, breaker=breaker, lane=lane)):
+        print("Logs sent to API successfully.")
+        return True
+    return False
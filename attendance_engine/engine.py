@@ -0,0 +1,202 @@
+"""The polling cycle shared by every branch script."""
+import sys
+import time
+import argparse
+from datetime import datetime
+from operator import attrgetter
+
+from . import config, profiling, startup
+from .aggregates import DailyAggregates, send_summaries
+from .archive import archive_logs
+from .clock import DeviceClock, host_to_utc
+from .config import get_settings
+from .delivery import delivery_url, send_logs_to_api
+from .hot_reload import ConfigWatcher
+from .presence import active_index, start_presence_server
+from .profiling import stage
+from .roster import Roster
+from .state import fetch_last_processed_time, save_last_processed_time, load_last_logs, save_last_logs
+from .transfer import connect_device, read_attendance
+
+def derive_log_entries(attendance_logs, last_processed_time, last_logs, strategy, settings, aggregates=None, presence=None,
+                       employee_ids=None, clock=None):
+    """
+    Classifies every punch at or after `last_processed_time`, in time order, and
+    returns the API entries. With a DeviceClock, punches are filtered and
+    ordered on their skew-corrected UTC times instead of the raw device times. Device user ids are translated through
+    `employee_ids` ({device_user_id: employee_id}) when given. `last_logs` is
+    updated in place with each employee's latest derived punch, and
+    `aggregates` (a DailyAggregates) and `presence` (a PresenceIndex) with
+    every classified punch when given.
+    """
+    if clock is None:
+        new_logs = [log for log in attendance_logs if log.timestamp >= last_processed_time]
+        new_logs.sort(key=attrgetter("timestamp"))
+    else:
+        cutoff = host_to_utc(last_processed_time)
+        selected = sorted((utc_time, index) for index, utc_time in enumerate(clock.normalize(attendance_logs)) if utc_time >= cutoff)
+        new_logs = [attendance_logs[index] for _, index in selected]
+
+    classify = strategy.classify
+    map_employee = employee_ids.get if employee_ids else None
+    get_last = last_logs.get
+    company_id = settings["company_id"]
+    branch_id = settings["branch_id"]
+    device_name = settings["device_name"]
+    created_at = datetime.now().isoformat()
+    date_strings = {}
+    logs_to_send = []
+    append = logs_to_send.append
+    aggregate = aggregates.add if aggregates is not None else None
+    mark_presence = presence.update if presence is not None else None
+
+    for log in new_logs:
+        log_time = log.timestamp
+        employee_id = map_employee(log.user_id, log.user_id) if map_employee else log.user_id
+        checklog = classify(employee_id, log_time, log.punch, get_last(employee_id))
+        if checklog is None:
+            continue
+        last_logs[employee_id] = (log_time, checklog)
+        if aggregate:
+            aggregate(employee_id, log_time, checklog)
+        if mark_presence:
+            mark_presence(employee_id, log_time, checklog, device_name)
+
+        log_date = log_time.date()
+        check_date = date_strings.get(log_date)
+        if check_date is None:
+            check_date = date_strings[log_date] = str(log_date)
+        append({
+            "employee_id": employee_id,
+            "company_id": company_id,
+            "branch_id": branch_id,
+            "check_date": check_date,
+            "check_time": log_time.strftime("%H:%M:%S"),
+            "checklog": checklog,
+            "device_name": device_name,
+            "createdAt": created_at,
+            "updatedAt": created_at
+        })
+
+    skipped = len(new_logs) - len(logs_to_send)
+    if skipped:
+        print(f"Ignored {skipped} of {len(new_logs)} new punches (repeats within the debounce window or outside the window).")
+    return logs_to_send
+
+def read_device_logs(settings, state_dir=".", roster=None, clock=None):
+    """
+    Connects to the device, reads every attendance record and disconnects.
+    The whole read must finish within DEVICE_READ_DEADLINE seconds; an
+    interrupted read is checkpointed in `state_dir` and resumed next time.
+    With a Roster, the device's user table is synced while connected and
+    unknown user ids are flagged; with a DeviceClock, the device clock is read.
+    """
+    deadline = time.monotonic() + config.DEVICE_READ_DEADLINE
+    conn = None
+    try:
+        with stage("connect"):
+            conn = connect_device(settings)
+        startup.mark("connect")
+        print("Connected to the device.")
+        if clock is not None:
+            clock.measure(conn)
+        with stage("read"):
+            if roster is None:
+                return read_attendance(conn, settings, state_dir, deadline)
+            roster.sync(conn)
+            attendance_logs = read_attendance(conn, settings, state_dir, deadline, roster.device_users())
+            roster.check_punches(conn, attendance_logs)
+            return attendance_logs
+    finally:
+        if conn:
+            conn.disconnect()
+            print("Disconnected from the device.")
+
+def fetch_and_process_logs(strategy, settings, state_dir="."):
+    """
+    Reads the device once, derives new entries with `strategy` and sends them to the API.
+    The device is read first and released before state files and shift data are loaded.
+    """
+    try:
+        with profiling.cycle(settings["device_name"]):
+            # Taken before connecting: a punch recorded while the device is being read
+            # is newer than this cutoff, so the next cycle still picks it up.
+            current_time = datetime.now()
+            roster = Roster(settings, state_dir)
+            clock = DeviceClock(settings, state_dir)
+            attendance_logs = read_device_logs(settings, state_dir, roster, clock)
+            startup.mark("read")
+            if config.ARCHIVE_LOGS:
+                archive_logs(attendance_logs, settings["archive_dir"])
+
+            last_processed_time = fetch_last_processed_time(state_dir) or settings["start_date"]
+            last_logs = load_last_logs(state_dir)
+            strategy.prepare(settings, state_dir)
+            aggregates = DailyAggregates(state_dir, track_pending=bool(settings.get("summary_api_url")))
+            aggregates.prepare(state_dir)
+            presence_index = active_index()
+            if presence_index:
+                presence_index.load_employee_info(aggregates.shift_data)
+                presence_index.seed(settings["device_name"], last_logs)
+            startup.mark("load state")
+
+            with stage("derive"):
+                logs_to_send = derive_log_entries(
+                    attendance_logs, last_processed_time, last_logs, strategy, settings,
+                    aggregates, presence_index, roster.employee_map, clock
+                )
+            aggregates.expire_open(current_time)
+            startup.mark("derive")
+
+            if logs_to_send:
+                with stage("send"):
+                    sent = send_logs_to_api(logs_to_send, delivery_url(settings))
+                if sent:
+                    save_last_processed_time(current_time, state_dir)
+                    save_last_logs(last_logs, state_dir)
+                    strategy.save(state_dir)
+                    aggregates.save()
+                    print(f"Updated last processed time to: {current_time}")
+                    send_summaries(aggregates, settings)
+                else:
+                    # Keep the previous employee state too, so the unsent punches are derived again next cycle.
+                    print("Logs were not saved, retaining the previous last processed time.")
+            startup.mark("send")
+
+    except Exception as e:
+        print("Process terminated:", e)
+
+def run_forever(strategy, default_start_date, state_dir="."):
+    """
+    Runs a polling cycle every CYCLE_INTERVAL seconds. Changes to .env are
+    picked up before the next cycle, without a restart.
+    """
+    watcher = ConfigWatcher(default_start_date, use_devices_file=False)
+    start_presence_server()
+    profiling.install_signal_handler()
+    while True:
+        devices, _changed = watcher.poll()
+        for settings in devices.values():
+            fetch_and_process_logs(strategy, settings, state_dir)
+        print(f"Waiting for the next cycle ({config.CYCLE_INTERVAL} seconds)...")
+        time.sleep(config.CYCLE_INTERVAL)
+
+def main(strategy, default_start_date, argv=None):
+    """
+    Entry point used by the branch scripts.
+    --once runs a single cycle and exits (for Task Scheduler / cron);
+    --profile-startup also prints where the startup time went.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--once", action="store_true", help="Run a single cycle and exit.")
+    parser.add_argument("--profile-startup", action="store_true", help="Run a single cycle and print a startup timing report.")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    startup.mark("imports")
+
+    if not (args.once or args.profile_startup):
+        run_forever(strategy, default_start_date)
+        return
+
+    fetch_and_process_logs(strategy, get_settings(default_start_date))
+    if args.profile_startup:
+        startup.print_report()
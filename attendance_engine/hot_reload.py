@@ -0,0 +1,69 @@
+"""
+Hot reload of .env and DEVICES_FILE for the long-running pollers.
+
+Before every cycle the watcher compares the modification stamps of both
+files with the last ones it saw, so an unchanged configuration costs two
+stat calls. On a change, .env is re-applied with config.reload_env() and the
+device list is rebuilt. Only the devices whose settings differ are reported
+as changed, so the caller resets just those and keeps everything else (warm
+caches, strategy instances, presence index, lane rate limiters) as it is.
+"""
+import os
+
+from . import config
+from .config import get_settings, load_devices, device_key
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, TypeError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class ConfigWatcher:
+    """
+    Tracks the settings of every polled device. `use_devices_file` is False
+    for the single-device branch scripts, which only read .env.
+    """
+
+    def __init__(self, default_start_date, use_devices_file=True):
+        self.default_start_date = default_start_date
+        self.use_devices_file = use_devices_file
+        self.env_stamp = file_stamp(config.ENV_FILE)
+        self.devices_stamp = file_stamp(config.DEVICES_FILE)
+        self.devices = self.load()
+
+    def load(self):
+        if self.use_devices_file:
+            devices = load_devices(self.default_start_date)
+        else:
+            devices = [get_settings(self.default_start_date)]
+        return {device_key(settings): settings for settings in devices}
+
+    def poll(self):
+        """Returns (devices by key, keys of devices added, removed or changed since the last poll)."""
+        env_stamp = file_stamp(config.ENV_FILE)
+        env_changed = env_stamp != self.env_stamp
+        if env_changed:
+            self.env_stamp = env_stamp
+            config.reload_env()
+        devices_stamp = file_stamp(config.DEVICES_FILE)
+        if not env_changed and (devices_stamp == self.devices_stamp or not self.use_devices_file):
+            return self.devices, set()
+        self.devices_stamp = devices_stamp
+
+        devices = self.load()
+        changed = {key for key in devices.keys() | self.devices.keys() if devices.get(key) != self.devices.get(key)}
+        for key in sorted(changed):
+            before, after = self.devices.get(key), devices.get(key)
+            if before is None:
+                print(f"Configuration reloaded: device {key} added.")
+            elif after is None:
+                print(f"Configuration reloaded: device {key} removed.")
+            else:
+                fields = sorted(field for field in before.keys() | after.keys() if before.get(field) != after.get(field))
+                print(f"Configuration reloaded: device {key} changed ({', '.join(fields)}).")
+        if not changed:
+            print("Configuration reloaded: no device settings changed.")
+        self.devices = devices
+        return devices, changed
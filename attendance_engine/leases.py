@@ -0,0 +1,164 @@
+"""
+Device leases shared by several poller nodes.
+
+The coordination store is a SQLite file on a volume every node can reach.
+A node polls only the devices it holds a lease on. Leases are renewed every
+cycle and again right before each device is polled, and expire after
+LEASE_SECONDS, so the devices of a node that dies are picked up by the others.
+Each device's state files (cursor, employee state, punch-code stats, open
+check-ins and the daily aggregates of the last LEASED_AGGREGATE_DAYS days) are
+stored next to its lease, so they move with it. Older aggregate days stay on
+the node that wrote them.
+"""
+import os
+import json
+import time
+import sqlite3
+from datetime import date, timedelta
+
+from . import config
+from .aggregates import AGGREGATES_DIR, AGGREGATES_STATE_FILE
+
+LEASE_REBALANCE_MARGIN = 1.25 # A node only gives devices away once it holds this much more than its fair share.
+COST_SMOOTHING = 0.3 # Weight of the latest cycle in a device's running cost.
+LEASED_STATE_FILES = ("last_processed_log_date.txt", "current_day_logs.txt", "punch_code_stats.txt", f"{AGGREGATES_DIR}/{AGGREGATES_STATE_FILE}")
+LEASED_AGGREGATE_DAYS = 7 # Days of daily aggregate files carried with a lease; covers open shifts and a short outage.
+
+def recent_aggregate_files(state_dir):
+    """The daily aggregate files of the last LEASED_AGGREGATE_DAYS days in `state_dir`."""
+    oldest = str(date.today() - timedelta(days=LEASED_AGGREGATE_DAYS))
+    try:
+        names = os.listdir(os.path.join(state_dir, AGGREGATES_DIR))
+    except FileNotFoundError:
+        return []
+    return [f"{AGGREGATES_DIR}/{name}" for name in names if name != AGGREGATES_STATE_FILE and name.endswith(".json") and name[:-5] >= oldest]
+
+class LeaseStore:
+    def __init__(self, path, node_id):
+        self.node_id = node_id
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS devices (
+                device_key TEXT PRIMARY KEY,
+                owner TEXT,
+                lease_expires REAL NOT NULL DEFAULT 0,
+                cost REAL,
+                state TEXT NOT NULL DEFAULT '{}'
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS nodes (
+                node_id TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            )""")
+
+    def register_devices(self, device_keys):
+        self.db.executemany("INSERT OR IGNORE INTO devices (device_key) VALUES (?)", [(key,) for key in device_keys])
+
+    def balance(self, device_keys):
+        """
+        Renews this node's leases, gives away surplus devices and claims free or
+        expired ones until the node carries its share of the total measured cost.
+        Returns the keys of the devices this node now holds.
+        """
+        now = time.time()
+        device_keys = set(device_keys)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("INSERT OR REPLACE INTO nodes (node_id, heartbeat) VALUES (?, ?)", (self.node_id, now))
+            live_nodes = self.db.execute("SELECT COUNT(*) FROM nodes WHERE heartbeat > ?", (now - config.LEASE_SECONDS,)).fetchone()[0]
+            rows = []
+            for row in self.db.execute("SELECT device_key, owner, lease_expires, cost FROM devices").fetchall():
+                if row[0] in device_keys:
+                    rows.append(row)
+                elif row[1] == self.node_id:
+                    # Removed from DEVICES_FILE: stop renewing it and counting its cost.
+                    self.db.execute("UPDATE devices SET owner = NULL, lease_expires = 0 WHERE device_key = ?", (row[0],))
+                    print(f"Released lease on {row[0]}: no longer listed in {config.DEVICES_FILE}.")
+            measured = [cost for _, _, _, cost in rows if cost is not None]
+            default_cost = sum(measured) / len(measured) if measured else 1.0
+            costs = {key: default_cost if cost is None else cost for key, _, _, cost in rows}
+            fair_share = sum(costs.values()) / max(live_nodes, 1)
+
+            held = sorted((key for key, owner, expires, _ in rows if owner == self.node_id and expires > now), key=costs.get)
+            held_cost = sum(costs[key] for key in held)
+            while len(held) > 1 and held_cost > fair_share * LEASE_REBALANCE_MARGIN and held_cost - costs[held[0]] >= fair_share:
+                released = held.pop(0)
+                held_cost -= costs[released]
+                self.db.execute("UPDATE devices SET owner = NULL, lease_expires = 0 WHERE device_key = ?", (released,))
+                print(f"Released lease on {released} to balance load.")
+
+            free = sorted(
+                (key for key, owner, expires, _ in rows if key in device_keys and key not in held and (owner is None or expires <= now)),
+                key=costs.get, reverse=True
+            )
+            for key in free:
+                if held and held_cost >= fair_share:
+                    break
+                self.db.execute("UPDATE devices SET owner = ?, lease_expires = ? WHERE device_key = ?", (self.node_id, now + config.LEASE_SECONDS, key))
+                held.append(key)
+                held_cost += costs[key]
+                print(f"Claimed lease on {key}.")
+
+            self.db.execute("UPDATE devices SET lease_expires = ? WHERE owner = ?", (now + config.LEASE_SECONDS, self.node_id))
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return [key for key in held if key in device_keys]
+
+    def renew(self, device_key):
+        """
+        Renews every lease this node holds and returns whether `device_key` is
+        still one of them. Called right before each device's cycle, so slow
+        devices earlier in the loop cannot let the later ones expire, and a
+        device claimed by another node meanwhile is skipped instead of polled.
+        """
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("INSERT OR REPLACE INTO nodes (node_id, heartbeat) VALUES (?, ?)", (self.node_id, now))
+            self.db.execute("UPDATE devices SET lease_expires = ? WHERE owner = ?", (now + config.LEASE_SECONDS, self.node_id))
+            held = self.db.execute("SELECT 1 FROM devices WHERE device_key = ? AND owner = ?", (device_key, self.node_id)).fetchone()
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return held is not None
+
+    def restore_state(self, device_key, state_dir):
+        """Writes the device's leased state files into its local state folder."""
+        os.makedirs(state_dir, exist_ok=True)
+        row = self.db.execute("SELECT state FROM devices WHERE device_key = ?", (device_key,)).fetchone()
+        state = json.loads(row[0]) if row else {}
+        # Recent aggregate days the stored state lacks are stale local copies and are removed too.
+        names = set(LEASED_STATE_FILES) | set(recent_aggregate_files(state_dir)) | {name for name in state if name.startswith(AGGREGATES_DIR + "/")}
+        for name in names:
+            path = os.path.join(state_dir, name)
+            if name in state:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as file:
+                    file.write(state[name])
+            elif os.path.exists(path):
+                os.remove(path)
+
+    def save_state(self, device_key, state_dir, cycle_seconds):
+        """
+        Stores the device's state files and updated cost, as long as this node
+        still holds the lease. Returns False when the lease was lost meanwhile.
+        """
+        state = {}
+        for name in LEASED_STATE_FILES + tuple(recent_aggregate_files(state_dir)):
+            try:
+                with open(os.path.join(state_dir, name), "r") as file:
+                    state[name] = file.read()
+            except FileNotFoundError:
+                pass
+        cursor = self.db.execute(
+            """UPDATE devices
+               SET state = ?, lease_expires = ?,
+                   cost = CASE WHEN cost IS NULL THEN ? ELSE cost * ? + ? END
+               WHERE device_key = ? AND owner = ?""",
+            (json.dumps(state), time.time() + config.LEASE_SECONDS, cycle_seconds,
+             1 - COST_SMOOTHING, cycle_seconds * COST_SMOOTHING, device_key, self.node_id)
+        )
+        return cursor.rowcount == 1
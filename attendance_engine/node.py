@@ -0,0 +1,60 @@
+"""
+Poller node: polls every device listed in DEVICES_FILE that this node holds a
+lease on in the shared coordination store (see leases.py). DEVICES_FILE and
+.env are watched between cycles (see hot_reload.py); a device whose settings
+changed starts its next cycle with a fresh strategy, the others keep theirs.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+
+from . import config, profiling
+from .config import device_state_dir
+from .engine import fetch_and_process_logs
+from .hot_reload import ConfigWatcher
+from .leases import LeaseStore
+from .presence import start_presence_server
+from .strategies import STRATEGIES
+
+def run_node(store_path, node_id, default_start_date, state_root="state"):
+    store = LeaseStore(store_path, node_id)
+    start_presence_server()
+    profiling.install_signal_handler()
+    print(f"Poller node {node_id} using lease store {store_path}.")
+    watcher = ConfigWatcher(default_start_date)
+    strategies = {}
+    while True:
+        devices, changed = watcher.poll()
+        for key in changed:
+            strategies.pop(key, None)
+        store.register_devices(devices)
+        held = store.balance(devices)
+        print(f"Holding {len(held)} of {len(devices)} devices.")
+
+        for key in held:
+            if not store.renew(key):
+                print(f"Lease on {key} was taken over by another node; skipping it this cycle.")
+                continue
+            settings = devices[key]
+            state_dir = device_state_dir(settings, state_root)
+            store.restore_state(key, state_dir)
+            started = time.perf_counter()
+            print(f"Polling {settings['device_name']} ({key}).")
+            strategy = strategies.get(key)
+            if strategy is None:
+                strategy = strategies[key] = STRATEGIES[settings.get("strategy", "toggle")]()
+            fetch_and_process_logs(strategy, settings, state_dir)
+            if not store.save_state(key, state_dir, time.perf_counter() - started):
+                print(f"Lease on {key} was lost during the cycle; its state was not stored.")
+
+        print(f"Waiting for the next cycle ({config.CYCLE_INTERVAL} seconds)...")
+        time.sleep(config.CYCLE_INTERVAL)
+
+def main(default_start_date, argv=None):
+    parser = argparse.ArgumentParser(description="Poll the devices this node holds a lease on.")
+    parser.add_argument("--store", default=os.getenv('LEASE_STORE', 'leases.db'), help="Path of the shared SQLite lease store.")
+    parser.add_argument("--node-id", default=os.getenv('NODE_ID', socket.gethostname()), help="Unique name of this node.")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    run_node(args.store, args.node_id, default_start_date)
@@ -0,0 +1,171 @@
+"""
+Local "who is inside" index and its HTTP/JSON endpoint.
+
+The poller updates the index in place for every derived punch, so the answer
+is current as soon as a cycle has classified a punch, without a round trip to
+the backend. Employees are grouped by department and shift, taken from the
+cached shift data (DEPARTMENT and SHIFT_NAME fields, the shift hours
+otherwise). Set PRESENCE_PORT to serve it:
+
+    GET /presence                        everyone inside (?department=&shift= to filter)
+    GET /presence/summary                head counts by department and shift
+    GET /presence/<employee_id>          one employee's last punch
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import config
+from .state import TIME_FORMAT
+
+class PresenceIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_seen = {}  # employee_id -> (log_time, checklog, device_name)
+        self.inside = {}     # employee_id -> check-in time
+        self.groups = {}     # ("department" | "shift", name) -> set of employee ids inside
+        self.member_of = {}  # employee_id -> group keys the employee was added to
+        self.labels = {}     # employee_id -> (department, shift)
+        self.employee_info = {}
+        self.seeded = set()
+
+    def load_employee_info(self, shift_data):
+        """Swaps in this cycle's shift data; group labels are derived lazily per employee."""
+        if shift_data is not self.employee_info:
+            with self.lock:
+                self.employee_info = shift_data
+                self.labels = {}
+
+    def label(self, employee_id):
+        labels = self.labels.get(employee_id)
+        if labels is None:
+            info = self.employee_info.get(employee_id) or {}
+            shift = info.get("SHIFT_NAME")
+            if shift is None and "SHIFT_START_TIME" in info:
+                shift = f"{info['SHIFT_START_TIME'][:5]}-{info.get('SHIFT_END_TIME', '23:59:59')[:5]}"
+            labels = self.labels[employee_id] = (info.get("DEPARTMENT"), shift)
+        return labels
+
+    def seed(self, device_name, last_logs):
+        """Loads a device's saved last punches the first time the device is seen in this process."""
+        if device_name in self.seeded:
+            return
+        self.seeded.add(device_name)
+        for employee_id, (log_time, checklog) in last_logs.items():
+            previous = self.last_seen.get(employee_id)
+            if previous is None or previous[0] < log_time:
+                self.update(employee_id, log_time, checklog, device_name)
+
+    def update(self, employee_id, log_time, checklog, device_name):
+        """Records one derived punch; O(1)."""
+        with self.lock:
+            self.last_seen[employee_id] = (log_time, checklog, device_name)
+            self.leave(employee_id)
+            if checklog == "in":
+                department, shift = self.label(employee_id)
+                keys = [key for key in (("department", department), ("shift", shift)) if key[1]]
+                self.inside[employee_id] = log_time
+                self.member_of[employee_id] = keys
+                for key in keys:
+                    self.groups.setdefault(key, set()).add(employee_id)
+
+    def leave(self, employee_id):
+        self.inside.pop(employee_id, None)
+        for key in self.member_of.pop(employee_id, ()):
+            self.groups[key].discard(employee_id)
+
+    def expire(self, now):
+        """Drops check-ins older than MAX_SHIFT_HOURS; they were never punched out."""
+        limit = now - timedelta(hours=config.MAX_SHIFT_HOURS)
+        for employee_id in [employee_id for employee_id, since in self.inside.items() if since < limit]:
+            self.leave(employee_id)
+
+    def employee(self, employee_id):
+        with self.lock:
+            seen = self.last_seen.get(employee_id)
+            if seen is None:
+                return None
+            department, shift = self.label(employee_id)
+            return {
+                "employee_id": employee_id,
+                "inside": employee_id in self.inside,
+                "last_seen": seen[0].strftime(TIME_FORMAT),
+                "checklog": seen[1],
+                "device_name": seen[2],
+                "department": department,
+                "shift": shift
+            }
+
+    def list_inside(self, department=None, shift=None):
+        with self.lock:
+            self.expire(datetime.now())
+            members = None
+            for key in (("department", department), ("shift", shift)):
+                if key[1] is not None:
+                    group = self.groups.get(key, set())
+                    members = group if members is None else members & group
+            employee_ids = self.inside if members is None else members
+            return [
+                {"employee_id": employee_id, "since": self.inside[employee_id].strftime(TIME_FORMAT), "device_name": self.last_seen[employee_id][2]}
+                for employee_id in employee_ids
+            ]
+
+    def summary(self):
+        with self.lock:
+            self.expire(datetime.now())
+            counts = {"department": {}, "shift": {}}
+            for (kind, name), members in self.groups.items():
+                if members:
+                    counts[kind][name] = len(members)
+            return {"inside": len(self.inside), "by_department": counts["department"], "by_shift": counts["shift"]}
+
+index = PresenceIndex()
+server = None
+
+def active_index():
+    """The process-wide index, or None when no presence endpoint is running."""
+    return index if server else None
+
+def make_handler(presence):
+    class PresenceHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if parts[:1] != ["presence"] or len(parts) > 2:
+                self.reply(404, {"error": "not found"})
+            elif len(parts) == 1:
+                query = parse_qs(url.query)
+                employees = presence.list_inside(query.get("department", [None])[0], query.get("shift", [None])[0])
+                self.reply(200, {"inside": len(employees), "employees": employees})
+            elif parts[1] == "summary":
+                self.reply(200, presence.summary())
+            else:
+                employee = presence.employee(parts[1])
+                self.reply(200 if employee else 404, employee or {"error": "employee not seen"})
+
+        def reply(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PresenceHandler
+
+def start_presence_server(port=None, host=None):
+    """Serves the index on PRESENCE_HOST:PRESENCE_PORT in a background thread, if a port is configured."""
+    global server
+    port = port or config.PRESENCE_PORT
+    if not port or server:
+        return server
+    host = host or config.PRESENCE_HOST
+    server = ThreadingHTTPServer((host, port), make_handler(index))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Presence endpoint listening on {host}:{port}.")
+    return server
@@ -0,0 +1,156 @@
+"""
+On-demand profiling of poll cycles.
+
+Profiling is requested for the next N cycles by PROFILE_CYCLES at start-up,
+by SIGUSR1 (PROFILE_SIGNAL_CYCLES cycles, where the platform has it) or by
+writing N into PROFILE_CONTROL_FILE, which is read and removed at the start
+of the next cycle. A profiled cycle runs under tracemalloc, and each stage
+(connect, read, decode, derive, serialize, send) gets its own cProfile
+profiler: entering a nested stage pauses the enclosing stage's profiler, so
+every stage's stats only cover its own time. Allocation diffs include nested
+stages. For every profiled cycle, PROFILE_DIR/<time>-<device>/ receives per
+stage:
+
+    <stage>.pstats             load with pstats or snakeviz
+    <stage>.collapsed          collapsed stacks for flamegraph.pl / speedscope
+    <stage>.allocations.txt    top allocation growth by line
+
+While nothing is requested, `stage` returns a shared no-op context manager.
+"""
+import os
+import re
+import signal
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from . import config
+
+NOT_PROFILING = nullcontext()
+COLLAPSED_MAX_DEPTH = 32
+
+requested = config.PROFILE_CYCLES # Cycles still to be profiled.
+current = None # CycleProfile of the cycle being profiled.
+
+def request(cycles):
+    global requested
+    requested += cycles
+    print(f"Profiling requested for the next {requested} cycles.")
+
+def install_signal_handler():
+    """Lets `kill -USR1 <pid>` request PROFILE_SIGNAL_CYCLES profiled cycles."""
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: request(config.PROFILE_SIGNAL_CYCLES))
+
+def check_control_file():
+    path = config.PROFILE_CONTROL_FILE
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, "r") as file:
+            cycles = int(file.read().strip() or 1)
+    except ValueError:
+        cycles = 1
+    os.remove(path)
+    request(cycles)
+
+class CycleProfile:
+    def __init__(self, label):
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", label)
+        self.dir = os.path.join(config.PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{name}")
+        self.profilers = {}
+        self.allocations = {}
+        self.stack = []
+
+    def dump(self):
+        os.makedirs(self.dir, exist_ok=True)
+        for name, profiler in self.profilers.items():
+            path = os.path.join(self.dir, name)
+            profiler.dump_stats(path + ".pstats")
+            write_collapsed_stacks(pstats.Stats(profiler), path + ".collapsed")
+            growth = sorted(self.allocations.get(name, {}).items(), key=lambda item: item[1][0], reverse=True)
+            with open(path + ".allocations.txt", "w") as file:
+                for where, (size, count) in growth[:config.PROFILE_TOP_ALLOCATIONS]:
+                    file.write(f"{size / 1024:10.1f} KiB {count:8d} blocks  {where}\n")
+        print(f"Profile of this cycle written to {self.dir}")
+
+@contextmanager
+def profiled_stage(profile, name):
+    outer = profile.stack[-1] if profile.stack else None
+    if outer:
+        outer.disable()
+    before = tracemalloc.take_snapshot()
+    profiler = profile.profilers.get(name)
+    if profiler is None:
+        profiler = profile.profilers[name] = cProfile.Profile()
+    profile.stack.append(profiler)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile.stack.pop()
+        growth = profile.allocations.setdefault(name, {})
+        for diff in tracemalloc.take_snapshot().compare_to(before, "lineno"):
+            if diff.size_diff > 0:
+                where = str(diff.traceback[0])
+                size, count = growth.get(where, (0, 0))
+                growth[where] = (size + diff.size_diff, count + diff.count_diff)
+        if outer:
+            outer.enable()
+
+def stage(name):
+    """Context manager marking a stage of the cycle; free unless the cycle is profiled."""
+    if current is None or threading.current_thread() is not current.thread:
+        return NOT_PROFILING
+    return profiled_stage(current, name)
+
+@contextmanager
+def cycle(label):
+    """Wraps one poll cycle, profiling it when profiling was requested."""
+    global current, requested
+    check_control_file()
+    if requested <= 0 or current is not None:
+        yield
+        return
+    requested -= 1
+    tracemalloc.start(config.PROFILE_TRACE_FRAMES)
+    profile = CycleProfile(label)
+    profile.thread = threading.current_thread()
+    current = profile
+    try:
+        with profiled_stage(profile, "cycle"):
+            yield
+    finally:
+        current = None
+        tracemalloc.stop()
+        profile.dump()
+
+def write_collapsed_stacks(stats, path):
+    """
+    Writes "caller;...;function microseconds" lines. cProfile keeps callers,
+    not whole stacks, so each function's own time is attributed to the chain
+    of its heaviest callers.
+    """
+    def label(func):
+        filename, line, name = func
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    entries = stats.stats
+    with open(path, "w") as file:
+        for func, (_calls, _primitive, own_time, _cumulative, callers) in entries.items():
+            if own_time <= 0:
+                continue
+            chain = [label(func)]
+            seen = {func}
+            while callers and len(chain) < COLLAPSED_MAX_DEPTH:
+                caller = max(callers, key=lambda candidate: callers[candidate][3])
+                if caller in seen or caller not in entries:
+                    break
+                seen.add(caller)
+                chain.append(label(caller))
+                callers = entries[caller][4]
+            file.write(f"{';'.join(reversed(chain))} {int(own_time * 1_000_000)}\n")
@@ -0,0 +1,243 @@
+"""
+Reconciliation of device punches against the records the API already stores.
+
+The checklog strategy the branch runs is replayed over a date range of
+punches, and every day is joined against that day's stored records (the
+RECORDS_API_URL read endpoint or MongoDB) on 8-byte digests. Punches come
+from the local archive one day at a time when it covers the range, so memory
+stays bounded by a single day; otherwise the device is read once and its
+punches are grouped by day. Differences go to a JSON-lines report, and
+--resend sends the punches missing upstream in the backfill lane,
+straight to API_URL so a relay's de-duplication cannot drop them.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+from . import config
+from .archive import archive_logs, archive_covers, iter_archived_days
+from .config import get_settings
+from .delivery import send_logs_to_api
+from .engine import read_device_logs
+from .roster import load_employee_map
+from .startup import lazy_import
+from .state import TIME_FORMAT
+from .strategies import STRATEGIES
+
+PAGE_SIZE = 1000
+RESEND_BATCH_SIZE = 500
+RECONCILE_STATE_DIR = "reconcile_state" # Scratch folder for interrupted device reads.
+
+def record_key(employee_id, check_date, check_time):
+    """Returns an 8-byte digest identifying a single punch."""
+    raw = f"{employee_id}|{check_date}|{check_time}".encode()
+    return hashlib.blake2b(raw, digest_size=8).digest()
+
+def iter_archive_days(start_date, end_date, archive_dir, employee_ids):
+    """
+    Yields (day, [(log_time, employee_id, punch), ...]) for every day in the
+    range from the archive, reading and sorting one day at a time.
+    """
+    for day, rows in iter_archived_days(start_date, end_date, archive_dir):
+        day_logs = [
+            (datetime.strptime(log_time, TIME_FORMAT), employee_ids.get(str(user_id), str(user_id)), punch)
+            for user_id, log_time, _status, punch in rows
+        ]
+        day_logs.sort(key=itemgetter(0, 1))
+        yield day, day_logs
+
+def iter_device_days(attendance_logs, start_date, end_date, employee_ids):
+    """
+    Yields (day, [(log_time, employee_id, punch), ...]) for every day in the
+    range from a device read, sorting each day only when it is reached.
+    Device user ids are translated through `employee_ids` like the poller does.
+    """
+    days = {}
+    for log in attendance_logs:
+        log_day = log.timestamp.date()
+        if start_date <= log_day <= end_date:
+            user_id = str(log.user_id)
+            days.setdefault(log_day, []).append((log.timestamp, employee_ids.get(user_id, user_id), log.punch))
+    day = start_date
+    while day <= end_date:
+        day_logs = days.pop(day, [])
+        day_logs.sort(key=itemgetter(0, 1))
+        yield day, day_logs
+        day += timedelta(days=1)
+
+def derive_day_checklogs(day_logs, last_logs, strategy):
+    """
+    Replays the checklog strategy used by the poller over one day
+    and returns {key: (employee_id, check_time, checklog)}.
+    """
+    expected = {}
+    for log_time, employee_id, punch in day_logs:
+        checklog = strategy.classify(employee_id, log_time, punch, last_logs.get(employee_id))
+        if checklog is None:
+            continue
+        last_logs[employee_id] = (log_time, checklog)
+        check_time = log_time.strftime("%H:%M:%S")
+        expected[record_key(employee_id, str(log_time.date()), check_time)] = (employee_id, check_time, checklog)
+    return expected
+
+def iter_api_records(day, branch_id, company_id):
+    """Streams one day of stored records from the read endpoint, page by page."""
+    requests = lazy_import("requests")
+    records_api_url = os.getenv('RECORDS_API_URL')
+    headers = {'x-api-key': os.getenv('X_API_KEY', '')}
+    page = 1
+    with requests.Session() as session:
+        while True:
+            params = {
+                "branch_id": branch_id,
+                "company_id": company_id,
+                "check_date": str(day),
+                "page": page,
+                "limit": PAGE_SIZE
+            }
+            response = session.get(records_api_url, params=params, headers=headers, timeout=30)
+            response.raise_for_status()
+            records = response.json().get("data", [])
+            yield from records
+            if len(records) < PAGE_SIZE:
+                return
+            page += 1
+
+def iter_mongo_records(day, branch_id, company_id):
+    """Streams one day of stored records straight from MongoDB."""
+    MongoClient = lazy_import("pymongo").MongoClient
+    client = MongoClient(os.getenv('MONGO_URI'))
+    try:
+        collection = client[os.getenv('MONGO_DB')][os.getenv('MONGO_COLLECTION', 'attendancelogs')]
+        query = {"branch_id": branch_id, "company_id": company_id, "check_date": str(day)}
+        projection = {"_id": 0, "employee_id": 1, "check_date": 1, "check_time": 1, "checklog": 1}
+        yield from collection.find(query, projection, batch_size=PAGE_SIZE)
+    finally:
+        client.close()
+
+def reconcile_day(expected, stored_records, report):
+    """
+    Joins one day of device-derived punches against the stored records.
+    Matched keys are popped, so whatever is left in `expected` is missing upstream.
+    Returns (matched, flipped, extra) counts.
+    """
+    matched = flipped = extra = 0
+    for record in stored_records:
+        key = record_key(str(record["employee_id"]), record["check_date"], record["check_time"])
+        device_entry = expected.pop(key, None)
+        if device_entry is None:
+            extra += 1
+            report.write(json.dumps({"type": "extra_on_api", **record}) + "\n")
+        elif device_entry[2] != record.get("checklog"):
+            flipped += 1
+            report.write(json.dumps({
+                "type": "flipped",
+                "employee_id": device_entry[0],
+                "check_date": record["check_date"],
+                "check_time": device_entry[1],
+                "device_checklog": device_entry[2],
+                "api_checklog": record.get("checklog")
+            }) + "\n")
+        else:
+            matched += 1
+    return matched, flipped, extra
+
+def resend_missing(missing_entries, api_url):
+    """Sends missing entries to the API in batches. Returns the number accepted."""
+    sent = 0
+    for i in range(0, len(missing_entries), RESEND_BATCH_SIZE):
+        batch = missing_entries[i:i + RESEND_BATCH_SIZE]
+        if send_logs_to_api(batch, api_url, lane="backfill"):
+            sent += len(batch)
+    return sent
+
+def iter_punch_days(settings, start_date, end_date, punch_source, employee_ids):
+    """Picks the archive or the device as the source of punches, like the backfill does."""
+    archive_dir = settings["archive_dir"]
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date, datetime.max.time())
+    if punch_source == "archive" or (punch_source == "auto" and archive_covers(start, end, archive_dir)):
+        print(f"Reading punches from the archive in {archive_dir}.")
+        return iter_archive_days(start_date, end_date, archive_dir, employee_ids)
+
+    os.makedirs(RECONCILE_STATE_DIR, exist_ok=True)
+    attendance_logs = read_device_logs(settings, RECONCILE_STATE_DIR)
+    if config.ARCHIVE_LOGS:
+        archive_logs(attendance_logs, archive_dir)
+    return iter_device_days(attendance_logs, start_date, end_date, employee_ids)
+
+def reconcile(start_date, end_date, strategy, source, resend, report_path, punch_source="auto"):
+    settings = get_settings(datetime.combine(start_date, datetime.min.time()))
+    branch_id = settings["branch_id"]
+    company_id = settings["company_id"]
+    strategy.prepare(settings)
+    employee_ids = load_employee_map(settings["employee_map_file"])
+    iter_stored_records = iter_mongo_records if source == "mongo" else iter_api_records
+    punch_days = iter_punch_days(settings, start_date, end_date, punch_source, employee_ids)
+
+    totals = {"matched": 0, "flipped": 0, "extra_on_api": 0, "missing_on_api": 0, "resent": 0}
+    last_logs = {}
+
+    with open(report_path, "w") as report:
+        for day, day_logs in punch_days:
+            expected = derive_day_checklogs(day_logs, last_logs, strategy)
+            matched, flipped, extra = reconcile_day(expected, iter_stored_records(day, branch_id, company_id), report)
+
+            missing_entries = []
+            for employee_id, check_time, checklog in expected.values():
+                report.write(json.dumps({
+                    "type": "missing_on_api",
+                    "employee_id": employee_id,
+                    "check_date": str(day),
+                    "check_time": check_time,
+                    "checklog": checklog
+                }) + "\n")
+                if resend:
+                    missing_entries.append({
+                        "employee_id": employee_id,
+                        "company_id": company_id,
+                        "branch_id": branch_id,
+                        "check_date": str(day),
+                        "check_time": check_time,
+                        "checklog": checklog,
+                        "device_name": settings["device_name"],
+                        "createdAt": datetime.now().isoformat(),
+                        "updatedAt": datetime.now().isoformat()
+                    })
+            if missing_entries:
+                totals["resent"] += resend_missing(missing_entries, settings["api_url"])
+
+            totals["matched"] += matched
+            totals["flipped"] += flipped
+            totals["extra_on_api"] += extra
+            totals["missing_on_api"] += len(expected)
+            print(f"{day}: matched={matched} flipped={flipped} extra_on_api={extra} missing_on_api={len(expected)}")
+
+    print("Reconciliation finished:", ", ".join(f"{name}={count}" for name, count in totals.items()))
+    print(f"Differences written to: {report_path}")
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare device punches against the records already stored by the API.")
+    parser.add_argument("--start", required=True, help="First day to reconcile (yyyy-mm-dd).")
+    parser.add_argument("--end", required=True, help="Last day to reconcile (yyyy-mm-dd).")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="toggle",
+                        help="Checklog strategy the branch runs (toggle, shift, punch_code, punch_code_aware).")
+    parser.add_argument("--source", choices=["api", "mongo"], default="mongo" if os.getenv('MONGO_URI') else "api",
+                        help="Where to read stored records from (defaults to mongo when MONGO_URI is set).")
+    parser.add_argument("--punch-source", choices=["auto", "archive", "device"], default="auto",
+                        help="Read punches from the local archive or the device (auto uses the archive when it covers the range).")
+    parser.add_argument("--resend", action="store_true", help="Send punches missing on the API side.")
+    parser.add_argument("--report", help="Path of the JSON-lines differences report.")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    start_date = datetime.strptime(args.start, "%Y-%m-%d").date()
+    end_date = datetime.strptime(args.end, "%Y-%m-%d").date()
+    if end_date < start_date:
+        parser.error("--end must not be before --start")
+    report_path = args.report or f"reconcile_{start_date}_{end_date}.jsonl"
+    reconcile(start_date, end_date, STRATEGIES[args.strategy](), args.source, args.resend, report_path, args.punch_source)
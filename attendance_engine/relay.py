@@ -0,0 +1,271 @@
+"""
+Relay service between branch agents and the ingest API.
+
+Branch agents with RELAY_URL set post their entries here instead of API_URL.
+The relay journals every accepted entry to disk before answering, drops
+entries it has already seen from any branch, and every RELAY_FLUSH_SECONDS
+merges what it has into time-ordered batches per delivery lane (taken from
+the X-Delivery-Lane header). RELAY_FORWARDERS workers, each holding one
+persistent connection, forward them to API_URL through the same weighted,
+rate-limited lane scheduler the branch agents use, so live punches overtake
+catch-up and backfill traffic. An employee's entries stay in the lane of their
+oldest pending entry until all of them are forwarded, and form a single
+stream with one batch in flight at a time, so their order is kept.
+A journal generation is deleted only after every batch in it was forwarded
+or, when the API rejected it with a 4xx answer, written to
+RELAY_DEAD_LETTER_FILE, so a restart replays whatever was still pending and
+no accepted entry is dropped silently. Rejected entries are dropped
+from the de-duplication keys, so they can be fixed and posted again. A 429
+answer pauses every forwarder for its Retry-After period.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import zlib
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import config
+from .delivery import LANES, LaneScheduler, backoff_delay, parse_retry_after
+from .startup import lazy_import
+
+RELAY_BATCH_SIZE = int(os.getenv('RELAY_BATCH_SIZE', 2000)) # Entries per forwarded request.
+RELAY_FLUSH_SECONDS = float(os.getenv('RELAY_FLUSH_SECONDS', 5)) # How long entries are merged before being forwarded.
+RELAY_FORWARDERS = int(os.getenv('RELAY_FORWARDERS', 4)) # Persistent connections to the ingest API.
+RELAY_DEDUP_DAYS = int(os.getenv('RELAY_DEDUP_DAYS', 2)) # Days of entry keys remembered for de-duplication.
+RELAY_JOURNAL_DIR = os.getenv('RELAY_JOURNAL_DIR', 'relay_journal')
+RELAY_DEAD_LETTER_FILE = os.getenv('RELAY_DEAD_LETTER_FILE', 'relay_dead_letter.jsonl') # Batches the API rejected, kept for inspection and resending.
+
+def entry_key(entry):
+    raw = "|".join(str(entry.get(field)) for field in ("company_id", "branch_id", "employee_id", "check_date", "check_time", "checklog"))
+    return hashlib.blake2b(raw.encode(), digest_size=8).digest()
+
+class Relay:
+    def __init__(self, api_url, journal_dir=RELAY_JOURNAL_DIR):
+        self.api_url = api_url
+        self.journal_dir = journal_dir
+        os.makedirs(journal_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.seen = {}  # check_date -> set of entry keys
+        self.generation = int(time.time() * 1000)
+        self.journal = open(self.journal_path(self.generation), "a")
+        self.pending = {}  # generation -> batches still being forwarded
+        self.employee_lanes = {}  # employee_id -> [lane, entries still being forwarded]
+        self.scheduler = LaneScheduler(size_of=lambda item: len(item[1]))
+        self.ready = threading.Condition()
+        self.resume_at = 0.0  # time.monotonic() until which a 429 answer paused forwarding
+        self.replay_pending()
+
+    def journal_path(self, generation):
+        return os.path.join(self.journal_dir, f"{generation}.jsonl")
+
+    def replay_pending(self):
+        """Loads entries from journals left behind by an earlier run."""
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "*.jsonl"))):
+            if path == self.journal_path(self.generation):
+                continue
+            with open(path, "r") as file:
+                records = [json.loads(line) for line in file if line.strip()]
+            for lane in LANES:
+                self.accept([entry for entry_lane, entry in records if entry_lane == lane], lane)
+            os.remove(path)
+            print(f"Replayed {len(records)} journaled entries from {path}.")
+
+    def accept(self, entries, lane):
+        """Journals and buffers new entries, skipping ones already seen. Returns how many were new."""
+        accepted = 0
+        with self.lock:
+            for entry in entries:
+                key = entry_key(entry)
+                day_keys = self.seen.setdefault(entry.get("check_date"), set())
+                if key in day_keys:
+                    continue
+                day_keys.add(key)
+                self.journal.write(json.dumps([lane, entry]) + "\n")
+                self.buffer.append((lane, entry))
+                accepted += 1
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+        return accepted
+
+    def flush(self):
+        """Merges the buffer into ordered batches and hands them to the forwarders."""
+        with self.lock:
+            if not self.buffer:
+                return
+            entries, self.buffer = self.buffer, []
+            generation = self.generation
+            self.journal.close()
+            self.generation = max(int(time.time() * 1000), generation + 1)
+            self.journal = open(self.journal_path(self.generation), "a")
+            self.prune_seen()
+
+        entries.sort(key=lambda item: (item[1].get("check_date", ""), item[1].get("check_time", "")))
+        streams = {}
+        with self.lock:
+            for lane, entry in entries:
+                employee_id = str(entry.get("employee_id"))
+                pinned = self.employee_lanes.get(employee_id)
+                if pinned is None:
+                    pinned = self.employee_lanes[employee_id] = [lane, 0]
+                pinned[1] += 1
+                stream = zlib.crc32(employee_id.encode()) % RELAY_FORWARDERS
+                streams.setdefault((pinned[0], stream), []).append(entry)
+            batch_count = sum((len(stream) + RELAY_BATCH_SIZE - 1) // RELAY_BATCH_SIZE for stream in streams.values())
+            self.pending[generation] = batch_count
+        with self.ready:
+            for (lane, stream), stream_entries in streams.items():
+                self.scheduler.add(lane, stream, [
+                    (generation, stream_entries[i:i + RELAY_BATCH_SIZE])
+                    for i in range(0, len(stream_entries), RELAY_BATCH_SIZE)
+                ])
+            self.ready.notify_all()
+        print(f"Forwarding {len(entries)} entries in {batch_count} batches.")
+
+    def prune_seen(self):
+        oldest = str(date.today() - timedelta(days=RELAY_DEDUP_DAYS))
+        for check_date in [day for day in self.seen if day is None or day < oldest]:
+            del self.seen[check_date]
+
+    def batch_done(self, generation, batch):
+        with self.lock:
+            for entry in batch:
+                employee_id = str(entry.get("employee_id"))
+                pinned = self.employee_lanes[employee_id]
+                pinned[1] -= 1
+                if not pinned[1]:
+                    del self.employee_lanes[employee_id]
+            self.pending[generation] -= 1
+            if self.pending[generation]:
+                return
+            del self.pending[generation]
+        os.remove(self.journal_path(generation))
+
+    def dead_letter(self, lane, batch, status, reason):
+        """
+        Keeps a batch the API rejected; it is fsynced before its journal can be deleted.
+        Its entries are forgotten by the de-duplication, so a fixed copy is accepted again.
+        """
+        with self.lock:
+            for entry in batch:
+                day_keys = self.seen.get(entry.get("check_date"))
+                if day_keys:
+                    day_keys.discard(entry_key(entry))
+            with open(RELAY_DEAD_LETTER_FILE, "a") as file:
+                file.write(json.dumps({
+                    "rejected_at": datetime.now().isoformat(), "status": status, "response": reason, "lane": lane, "entries": batch
+                }) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+        print(f"API rejected a batch of {len(batch)} entries (HTTP {status}); kept in {RELAY_DEAD_LETTER_FILE}.")
+
+    def wait_for_resume(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def next_batch(self):
+        """Blocks until the lane scheduler hands out a batch; returns (lane, stream, (generation, batch))."""
+        with self.ready:
+            while True:
+                picked = self.scheduler.next_item()
+                if picked:
+                    return picked
+                self.ready.wait(self.scheduler.retry_in())
+
+    def forward(self):
+        """Forwarder worker: posts batches over one persistent connection, retrying until the API takes them."""
+        requests = lazy_import("requests")
+        session = requests.Session()
+        while True:
+            lane, stream, (generation, batch) = self.next_batch()
+            attempt = 0
+            while True:
+                self.wait_for_resume()
+                try:
+                    response = session.post(self.api_url, json=batch, timeout=config.API_TIMEOUT)
+                    if response.status_code == 200:
+                        if not response.json().get("success"):
+                            print("API response: Duplicate or existing logs.")
+                        break
+                    if response.status_code == 429:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+                        print(f"API rate limit reached, pausing forwarding for {retry_after:.0f} seconds.")
+                        continue
+                    if response.status_code < 500:
+                        self.dead_letter(lane, batch, response.status_code, response.text)
+                        break
+                    error = f"HTTP {response.status_code}"
+                except requests.exceptions.RequestException as e:
+                    error = e
+                attempt += 1
+                delay = backoff_delay(attempt)
+                print(f"Forwarding failed ({error}), retrying in {delay:.1f} seconds.")
+                time.sleep(delay)
+            with self.ready:
+                self.scheduler.finish(lane, stream)
+                self.ready.notify_all()
+            self.batch_done(generation, batch)
+
+    def run_flusher(self):
+        while True:
+            time.sleep(RELAY_FLUSH_SECONDS)
+            self.flush()
+
+    def start(self):
+        for _ in range(RELAY_FORWARDERS):
+            threading.Thread(target=self.forward, daemon=True).start()
+        threading.Thread(target=self.run_flusher, daemon=True).start()
+        self.flush()
+
+def make_handler(relay):
+    class RelayHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                entries = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if not isinstance(entries, list):
+                    raise ValueError("expected a list of log entries")
+            except ValueError as e:
+                self.reply(400, {"success": False, "error": str(e)})
+                return
+            lane = self.headers.get("X-Delivery-Lane", "catchup")
+            if lane not in LANES:
+                lane = "catchup"
+            accepted = relay.accept(entries, lane)
+            self.reply(200, {"success": True, "accepted": accepted, "duplicates": len(entries) - accepted})
+
+        def reply(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return RelayHandler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relay branch agents' log entries to the ingest API in large ordered batches.")
+    parser.add_argument("--host", default=os.getenv('RELAY_HOST', '0.0.0.0'))
+    parser.add_argument("--port", type=int, default=int(os.getenv('RELAY_PORT', 8090)))
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    relay = Relay(os.getenv('API_URL'))
+    relay.start()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(relay))
+    print(f"Relay listening on {args.host}:{args.port}, forwarding to {relay.api_url}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        relay.flush()
+        print("Relay stopped; pending entries stay in the journal for the next start.")
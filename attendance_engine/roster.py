@@ -0,0 +1,125 @@
+"""
+Cached device roster and the device user id -> HRMS employee id mapping.
+
+The device's user table is downloaded only when it looks different from the
+cached copy (device_roster.json in the state folder): the user and card
+counts reported by read_sizes() changed, the copy is older than
+ROSTER_MAX_AGE_HOURS, or punches arrived from a user id the copy has never
+seen. Punch user ids are mapped to HRMS employee ids through
+EMPLOYEE_MAP_FILE (a "device_user_id,employee_id" CSV); ids missing from the
+roster or the map are flagged once each in unknown_employees.jsonl.
+"""
+import os
+import csv
+import json
+import time
+import hashlib
+from datetime import datetime
+from collections import namedtuple
+
+from . import config
+from .state import TIME_FORMAT, write_file_atomic
+
+ROSTER_FILE = "device_roster.json"
+UNKNOWN_EMPLOYEES_FILE = "unknown_employees.jsonl"
+
+RosterUser = namedtuple("RosterUser", ["uid", "user_id", "name", "card"])
+
+def load_employee_map(path):
+    """Returns {device_user_id: employee_id} from the mapping CSV, or {} without one."""
+    if not path:
+        return {}
+    try:
+        with open(path, "r", newline="") as file:
+            return {row["device_user_id"].strip(): row["employee_id"].strip() for row in csv.DictReader(file) if row.get("employee_id")}
+    except FileNotFoundError:
+        return {}
+
+class Roster:
+    def __init__(self, settings, state_dir="."):
+        self.path = os.path.join(state_dir, ROSTER_FILE)
+        self.unknown_path = os.path.join(state_dir, UNKNOWN_EMPLOYEES_FILE)
+        self.device_name = settings["device_name"]
+        try:
+            with open(self.path, "r") as file:
+                cached = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            cached = {}
+        self.fingerprint = cached.get("fingerprint")
+        self.synced_at = cached.get("synced_at", 0)
+        self.checksum = cached.get("checksum")
+        self.users = {user[1]: RosterUser(*user) for user in cached.get("users", [])}
+        self.employee_map = load_employee_map(settings.get("employee_map_file"))
+        self.flagged = set()
+        try:
+            with open(self.unknown_path, "r") as file:
+                self.flagged = {json.loads(line)["user_id"] for line in file}
+        except FileNotFoundError:
+            pass
+
+    def device_users(self):
+        return list(self.users.values())
+
+    def sync(self, conn, force=False):
+        """
+        Downloads the device's users when the counts changed, the cache is too
+        old or `force` is set. Returns True when a download happened.
+        """
+        conn.read_sizes()
+        fingerprint = [conn.users, conn.cards]
+        fresh = time.time() - self.synced_at < config.ROSTER_MAX_AGE_HOURS * 3600
+        if not force and fresh and fingerprint == self.fingerprint:
+            return False
+
+        users = sorted((RosterUser(user.uid, str(user.user_id), user.name, user.card) for user in conn.get_users()), key=lambda user: user.uid)
+        checksum = hashlib.blake2b(json.dumps(users).encode(), digest_size=16).hexdigest()
+        if checksum != self.checksum:
+            print(f"Roster of {self.device_name} updated: {len(users)} users.")
+        self.users = {user.user_id: user for user in users}
+        self.fingerprint, self.synced_at, self.checksum = fingerprint, time.time(), checksum
+        write_file_atomic(self.path, json.dumps({
+            "fingerprint": fingerprint, "synced_at": self.synced_at, "checksum": checksum, "users": users
+        }))
+        return True
+
+    def unseen(self, user_ids):
+        """User ids neither in the cached roster nor flagged before."""
+        return {user_id for user_id in user_ids if user_id not in self.users and user_id not in self.flagged}
+
+    def relabel(self, attendance_logs):
+        """
+        Gives records decoded with the older roster (8-byte records of users
+        enrolled since then carry only str(uid)) their user ids from the fresh
+        one. Returns the set of user ids afterwards.
+        """
+        by_uid = {user.uid: user.user_id for user in self.users.values()}
+        user_ids = set()
+        for log in attendance_logs:
+            if str(log.user_id) not in self.users and log.uid in by_uid:
+                log.user_id = by_uid[log.uid]
+            user_ids.add(str(log.user_id))
+        return user_ids
+
+    def check_punches(self, conn, attendance_logs):
+        """
+        Re-syncs once if punches carry user ids the cache has never seen (and
+        relabels the punches decoded before it), then flags ids still unknown
+        to the roster or the employee map.
+        """
+        user_ids = {str(log.user_id) for log in attendance_logs}
+        if self.unseen(user_ids) and self.sync(conn, force=True):
+            user_ids = self.relabel(attendance_logs)
+        unknown = []
+        for user_id in sorted(user_ids - self.flagged):
+            if user_id not in self.users:
+                unknown.append({"user_id": user_id, "reason": "not on the device roster"})
+            elif self.employee_map and user_id not in self.employee_map:
+                unknown.append({"user_id": user_id, "reason": "no HRMS employee id in the employee map"})
+        if unknown:
+            flagged_at = datetime.now().strftime(TIME_FORMAT)
+            with open(self.unknown_path, "a") as file:
+                for entry in unknown:
+                    file.write(json.dumps({**entry, "device_name": self.device_name, "flagged_at": flagged_at}) + "\n")
+            self.flagged.update(entry["user_id"] for entry in unknown)
+            print(f"Flagged {len(unknown)} unknown user ids on {self.device_name} (see {self.unknown_path}).")
+        return unknown
@@ -0,0 +1,133 @@
+"""
+Device-side log rotation.
+
+Clearing the device's attendance log keeps every read small, but it is only
+safe once every record on the device is both in the local archive and
+acknowledged by the API, judged on the skew-corrected timeline the poller
+uses. `rotate_device_logs` checks both and verifies the archive against the
+device with the device disabled (so no punch can arrive in between). Only
+then does it clear the log. Each rotation is recorded in
+archive/rotations.jsonl.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime
+
+from . import config
+from .archive import archive_logs, load_archive_cursor, iter_archived_logs
+from .clock import DeviceClock, host_to_utc
+from .config import get_settings, find_device, device_state_dir
+from .state import fetch_last_processed_time, TIME_FORMAT
+from .transfer import connect_device
+
+ROTATIONS_FILE = "rotations.jsonl"
+
+def records_fingerprint(records):
+    """Returns (count, order-independent checksum) of a set of punches."""
+    count = 0
+    checksum = 0
+    for record in records:
+        key = f"{record.user_id}|{record.timestamp.strftime(TIME_FORMAT)}|{record.status}|{record.punch}".encode()
+        checksum = (checksum + int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")) % (1 << 64)
+        count += 1
+    return count, checksum
+
+def check_rotation_safe(attendance_logs, archive_dir, clock, state_dir="."):
+    """
+    Returns (safe, reason, details) for clearing the given device records.
+    `clock` is a DeviceClock measured on the same connection: the records are
+    compared with last_processed_time on the normalized timeline the poller
+    uses, and a device clock off by more than CLOCK_SKEW_TOLERANCE is refused,
+    since older punches may have been taken at another skew.
+    """
+    if not attendance_logs:
+        return False, "device holds no records", {}
+    oldest = min(log.timestamp for log in attendance_logs)
+    newest = max(log.timestamp for log in attendance_logs)
+    details = {"records": len(attendance_logs), "oldest": str(oldest), "newest": str(newest), "clock_skew": round(clock.skew, 1)}
+
+    archive_logs(attendance_logs, archive_dir)
+    archived_until, _, _ = load_archive_cursor(archive_dir)
+    if archived_until is None or archived_until < newest:
+        return False, f"archive only reaches {archived_until}", details
+
+    if abs(clock.skew) > config.CLOCK_SKEW_TOLERANCE:
+        return False, f"device clock is {abs(clock.skew):.0f} s {'ahead' if clock.skew > 0 else 'behind'}; set it right before rotating", details
+    acknowledged_until = fetch_last_processed_time(state_dir)
+    if acknowledged_until is None or host_to_utc(acknowledged_until) <= max(clock.normalize(attendance_logs)):
+        return False, f"API has only acknowledged punches before {acknowledged_until}", details
+
+    device_fingerprint = records_fingerprint(attendance_logs)
+    archive_fingerprint = records_fingerprint(iter_archived_logs(oldest, newest, archive_dir))
+    details["device_fingerprint"] = device_fingerprint
+    details["archive_fingerprint"] = archive_fingerprint
+    if device_fingerprint != archive_fingerprint:
+        return False, "archive does not match the device records", details
+    return True, "every record is archived and acknowledged", details
+
+def rotate_device_logs(settings, min_records=0, dry_run=False, state_dir="."):
+    """Clears the device's attendance log once it is verified safe. Returns True if it was cleared."""
+    conn = None
+    try:
+        conn = connect_device(settings)
+        print("Connected to the device.")
+        conn.disable_device()
+        try:
+            clock = DeviceClock(settings, state_dir)
+            clock.measure(conn)
+            attendance_logs = conn.get_attendance()
+            safe, reason, details = check_rotation_safe(attendance_logs, settings["archive_dir"], clock, state_dir)
+            print(f"Device holds {len(attendance_logs)} records: {reason}.")
+            if not safe:
+                return False
+            if len(attendance_logs) < min_records:
+                print(f"Not rotating: fewer than {min_records} records on the device.")
+                return False
+            if dry_run:
+                print("Dry run: the device log would be cleared now.")
+                return False
+
+            conn.clear_attendance()
+            conn.read_sizes()
+            if conn.records:
+                print(f"Device still reports {conn.records} records after clearing.")
+                return False
+            with open(os.path.join(settings["archive_dir"], ROTATIONS_FILE), "a") as file:
+                file.write(json.dumps({"rotated_at": datetime.now().strftime(TIME_FORMAT), **details}) + "\n")
+            print(f"Cleared {len(attendance_logs)} records from the device.")
+            return True
+        finally:
+            conn.enable_device()
+    except Exception as e:
+        print("Rotation aborted:", e)
+        return False
+    finally:
+        if conn:
+            conn.disconnect()
+            print("Disconnected from the device.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clear the device's attendance log once every record is archived and acknowledged by the API.")
+    parser.add_argument("--min-records", type=int, default=0, help="Only rotate when the device holds at least this many records.")
+    parser.add_argument("--dry-run", action="store_true", help="Run every check but do not clear the device.")
+    parser.add_argument("--device", help="Device from DEVICES_FILE (ip:port, IP or name) to rotate, with the state and archive folders a poller node keeps for it.")
+    parser.add_argument("--state-dir", help="State folder holding last_processed_log_date.txt (defaults to the current folder, or state/<ip>_<port> with --device).")
+    parser.add_argument("--archive-dir", help="Archive folder of the device (defaults to ARCHIVE_DIR, or the device's own folder with --device).")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.device:
+        settings = find_device(args.device)
+        if settings is None:
+            parser.error(f"device {args.device} is not listed in {config.DEVICES_FILE}")
+        state_dir = device_state_dir(settings)
+    else:
+        settings = get_settings(None)
+        state_dir = "."
+    if args.archive_dir:
+        settings["archive_dir"] = args.archive_dir
+    state_dir = args.state_dir or state_dir
+    print(f"Using state folder {state_dir} and archive folder {settings['archive_dir']}.")
+    rotate_device_logs(settings, args.min_records, args.dry_run, state_dir)
@@ -0,0 +1,107 @@
+"""Employee shift configuration, fetched from SHIFT_API_URL and cached on disk."""
+import os
+import json
+from datetime import datetime, timedelta
+
+from .startup import lazy_import
+
+SHIFT_DATA_FILE = "employee_shift_data.txt"
+
+def load_employee_shift_data(state_dir="."):
+    """Load employee shift data from file."""
+    try:
+        with open(os.path.join(state_dir, SHIFT_DATA_FILE), "r") as file:
+            data = json.load(file)
+            if data.get("success") and "data" in data:
+                return data["data"]
+            return {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_employee_shift_data(shift_data, state_dir="."):
+    """Save employee shift data to file."""
+    with open(os.path.join(state_dir, SHIFT_DATA_FILE), "w") as file:
+        json.dump(shift_data, file)
+
+def fetch_employee_shift_data(state_dir="."):
+    """Fetch employee shift configurations from API."""
+    requests = lazy_import("requests")
+    try:
+        branch_id = os.getenv('BRANCH_ID')
+        company_id = os.getenv('COMPANY_ID')
+        api_key = os.getenv('X_API_KEY')
+        shift_api_url = os.getenv('SHIFT_API_URL')
+
+        if not all([branch_id, company_id, api_key, shift_api_url]):
+            return None
+
+        url = f"{shift_api_url}?branch_id={branch_id}&company_id={company_id}"
+        headers = {
+            'x-api-key': api_key,
+            'Content-Type': 'application/json'
+        }
+
+        response = requests.get(url, headers=headers, timeout=10)
+
+        if response.status_code == 200:
+            api_response = response.json()
+            if api_response.get("success") and "data" in api_response:
+                save_employee_shift_data(api_response, state_dir)
+                return api_response["data"]
+        return None
+
+    except requests.exceptions.RequestException as e:
+        print(f"Network error while fetching shift data: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected error while fetching shift data: {e}")
+        return None
+
+def get_employee_shift_data(state_dir="."):
+    """Returns fresh shift data from the API, falling back to the cached file."""
+    shift_data = fetch_employee_shift_data(state_dir)
+    if shift_data is None:
+        shift_data = load_employee_shift_data(state_dir)
+    return shift_data
+
+def parse_shift_config(shift_config):
+    """Returns (shift_start_time, shift_end_time, spans_midnight) for a shift config."""
+    start_time_str = shift_config.get('SHIFT_START_TIME', '09:00:00')
+    end_time_str = shift_config.get('SHIFT_END_TIME', '23:59:59')
+    return (
+        datetime.strptime(start_time_str, "%H:%M:%S").time(),
+        datetime.strptime(end_time_str, "%H:%M:%S").time(),
+        shift_config.get('SHIFT_SPANS_MIDNIGHT', False)
+    )
+
+def is_within_employee_shift_range(current_log_time, last_log_time, shift):
+    """
+    Check if log time falls within the same shift instance as the last log.
+    `shift` is the tuple returned by parse_shift_config.
+    """
+    if not shift or not last_log_time:
+        return False
+
+    shift_start_time, shift_end_time, spans_midnight = shift
+
+    if not spans_midnight:
+        if current_log_time.date() > last_log_time.date():
+            return False
+        current_time_only = current_log_time.time()
+        return shift_start_time <= current_time_only <= shift_end_time
+
+    shift_start_boundary = datetime.combine(last_log_time.date(), shift_start_time)
+    shift_end_boundary = datetime.combine(last_log_time.date() + timedelta(days=1), shift_end_time)
+    last_log_in_shift = shift_start_boundary <= last_log_time <= shift_end_boundary
+
+    if not last_log_in_shift:
+        shift_start_boundary = datetime.combine(last_log_time.date() - timedelta(days=1), shift_start_time)
+        shift_end_boundary = datetime.combine(last_log_time.date(), shift_end_time)
+        last_log_in_shift = shift_start_boundary <= last_log_time <= shift_end_boundary
+
+    current_log_in_shift = shift_start_boundary <= current_log_time <= shift_end_boundary
+
+    if last_log_in_shift and not current_log_in_shift:
+        return False
+
+    return current_log_in_shift
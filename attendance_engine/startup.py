@@ -0,0 +1,42 @@
+"""
+Startup timing for one-shot runs.
+
+Heavy modules (aiohttp, requests, zk, openpyxl, ...) are imported through
+`lazy_import` at the point they are first needed, so a run only pays for what
+it uses. With --profile-startup, `print_report` shows how long each phase and
+each deferred import took since the attendance_engine package was imported.
+"""
+import sys
+import time
+import importlib
+
+STARTED_AT = time.perf_counter()
+phases = []
+import_times = {}
+
+def mark(phase):
+    """Records the end of a startup phase."""
+    phases.append((phase, time.perf_counter()))
+
+def lazy_import(name):
+    """Imports a module on first use and records how long the import took."""
+    if name in sys.modules:
+        # import_module also waits for an import still running in another thread.
+        return importlib.import_module(name)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    import_times[name] = time.perf_counter() - start
+    return module
+
+def print_report():
+    """Prints an -X importtime style breakdown of the run so far."""
+    print("Startup profile (ms since attendance_engine was imported):")
+    previous = STARTED_AT
+    for phase, at in phases:
+        print(f"  {phase:<24} {(at - previous) * 1000:9.1f}  (at {(at - STARTED_AT) * 1000:9.1f})")
+        previous = at
+    if import_times:
+        print("Deferred imports:")
+        for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True):
+            print(f"  {name:<24} {seconds * 1000:9.1f}")
+    print("For a full per-module breakdown run: python -X importtime <script> --once")
@@ -0,0 +1,54 @@
+"""Local state files: the last processed time and each employee's last punch."""
+import os
+import json
+from datetime import datetime
+
+LAST_PROCESSED_FILE = "last_processed_log_date.txt"
+LAST_LOGS_FILE = "current_day_logs.txt"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def write_file_atomic(path, content):
+    """Writes a file through a temporary copy so a crash never leaves it half written."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+def fetch_last_processed_time(state_dir="."):
+    """Reads the last processed timestamp from a file."""
+    try:
+        with open(os.path.join(state_dir, LAST_PROCESSED_FILE), "r") as file:
+            return datetime.strptime(file.read().strip(), TIME_FORMAT)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save_last_processed_time(timestamp, state_dir="."):
+    """Saves the last processed timestamp to a file."""
+    write_file_atomic(os.path.join(state_dir, LAST_PROCESSED_FILE), timestamp.strftime(TIME_FORMAT))
+
+def load_last_logs(state_dir="."):
+    """
+    Loads each employee's last punch as {employee_id: (log_time, checklog)}.
+    Times are parsed once here instead of on every punch.
+    """
+    try:
+        with open(os.path.join(state_dir, LAST_LOGS_FILE), "r") as file:
+            data = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {
+        employee_id: (datetime.strptime(entry['log_time'], TIME_FORMAT), entry['checklog'])
+        for employee_id, entry in data.items()
+    }
+
+def save_last_logs(last_logs, state_dir="."):
+    """Saves each employee's last punch in the current_day_logs.txt format."""
+    data = {
+        employee_id: {
+            "log_time": log_time.strftime(TIME_FORMAT),
+            "checklog": checklog,
+            "log_date": str(log_time.date())
+        }
+        for employee_id, (log_time, checklog) in last_logs.items()
+    }
+    write_file_atomic(os.path.join(state_dir, LAST_LOGS_FILE), json.dumps(data))
@@ -0,0 +1,187 @@
+"""
+Checklog strategies.
+
+A strategy turns one device punch into "in", "out" or None (punch ignored),
+given the employee's previous punch as a (log_time, checklog) tuple or None.
+Punches reach `classify` sorted by time. `prepare` is called once per cycle
+before the punches are classified, and `save` after they were sent.
+"""
+import os
+import json
+from datetime import timedelta
+
+from .shifts import get_employee_shift_data, parse_shift_config, is_within_employee_shift_range
+
+PUNCH_CODE_STATS_FILE = "punch_code_stats.txt"
+PUNCH_IN_CODES = frozenset((0, 3, 4)) # Check-in, break-in, overtime-in.
+PUNCH_CODE_MIN_SAMPLES = 20 # Punches needed before auto mode trusts the device's codes.
+PUNCH_CODE_MIN_SHARE = 0.2 # Least share of in or out codes expected from a device that really sets them.
+PUNCH_CODE_MAX_SAMPLES = 1000 # Stored counts are halved above this, so the estimate follows recent behaviour.
+
+class ToggleStrategy:
+    """Alternates in/out per employee and starts every new day with "in"."""
+
+    name = "toggle"
+
+    def __init__(self, debounce_seconds=None):
+        self.debounce_seconds = debounce_seconds
+        self.debounce = timedelta(seconds=debounce_seconds or 0)
+
+    def prepare(self, settings, state_dir="."):
+        if self.debounce_seconds is None:
+            self.debounce = timedelta(seconds=settings["debounce_seconds"])
+
+    def save(self, state_dir="."):
+        pass
+
+    def classify(self, employee_id, log_time, punch, last):
+        if last is None:
+            return "in"
+        last_log_time, last_checklog = last
+        if log_time.date() > last_log_time.date():
+            return "in"
+        if log_time - last_log_time <= self.debounce:
+            return None
+        return "out" if last_checklog == "in" else "in"
+
+class ShiftStrategy(ToggleStrategy):
+    """
+    Alternates in/out within an employee's shift, using the shift data from
+    SHIFT_API_URL so shifts spanning midnight are not split at the date change.
+    """
+
+    name = "shift"
+
+    def __init__(self, debounce_seconds=None):
+        super().__init__(debounce_seconds)
+        self.employee_shift_data = {}
+        self.parsed_shifts = {}
+
+    def prepare(self, settings, state_dir="."):
+        super().prepare(settings, state_dir)
+        self.employee_shift_data = get_employee_shift_data(state_dir)
+        self.parsed_shifts = {}
+
+    def get_shift(self, employee_id):
+        """Returns the parsed shift for an employee, parsing each config only once per cycle."""
+        if employee_id not in self.parsed_shifts:
+            shift_config = self.employee_shift_data.get(employee_id)
+            self.parsed_shifts[employee_id] = parse_shift_config(shift_config) if shift_config else None
+        return self.parsed_shifts[employee_id]
+
+    def classify(self, employee_id, log_time, punch, last):
+        if last is None:
+            return "in"
+        last_log_time, last_checklog = last
+        if log_time - last_log_time <= self.debounce:
+            return None
+
+        shift = self.get_shift(employee_id)
+        if not shift or not shift[2]:
+            if log_time.date() > last_log_time.date():
+                return "in"
+            return "out" if last_checklog == "in" else "in"
+
+        if is_within_employee_shift_range(log_time, last_log_time, shift):
+            return "out" if last_checklog == "in" else "in"
+        return "in"
+
+class PunchCodeStrategy:
+    """Trusts the device punch code: 0 is "in", anything else is "out"."""
+
+    name = "punch_code"
+
+    def prepare(self, settings, state_dir="."):
+        pass
+
+    def save(self, state_dir="."):
+        pass
+
+    def classify(self, employee_id, log_time, punch, last):
+        return "in" if punch == 0 else "out"
+
+class PunchCodeAwareStrategy(ShiftStrategy):
+    """
+    Uses the device punch code when the device really sets it and falls back to
+    shift-aware toggling when it does not. Repeat punches within the device's
+    debounce window are always ignored.
+
+    PUNCH_CODE_MODE=trust always uses the codes, ignore never does, and auto
+    (default) trusts them once enough punches were seen and both in and out
+    codes make up a plausible share. The counts are kept per device in
+    punch_code_stats.txt and updated as punches are classified.
+    """
+
+    name = "punch_code_aware"
+
+    def __init__(self, debounce_seconds=None):
+        super().__init__(debounce_seconds)
+        self.mode = "auto"
+        self.in_codes = 0
+        self.out_codes = 0
+
+    def prepare(self, settings, state_dir="."):
+        super().prepare(settings, state_dir)
+        self.mode = settings["punch_code_mode"]
+        try:
+            with open(os.path.join(state_dir, PUNCH_CODE_STATS_FILE), "r") as file:
+                stats = json.load(file)
+            self.in_codes, self.out_codes = stats["in"], stats["out"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            self.in_codes = self.out_codes = 0
+
+    def save(self, state_dir="."):
+        if self.in_codes + self.out_codes > PUNCH_CODE_MAX_SAMPLES:
+            self.in_codes //= 2
+            self.out_codes //= 2
+        with open(os.path.join(state_dir, PUNCH_CODE_STATS_FILE), "w") as file:
+            json.dump({"in": self.in_codes, "out": self.out_codes}, file)
+
+    def punch_codes_reliable(self):
+        if self.mode == "trust":
+            return True
+        if self.mode == "ignore":
+            return False
+        total = self.in_codes + self.out_codes
+        return total >= PUNCH_CODE_MIN_SAMPLES and min(self.in_codes, self.out_codes) >= total * PUNCH_CODE_MIN_SHARE
+
+    def classify(self, employee_id, log_time, punch, last):
+        code_says_in = punch in PUNCH_IN_CODES
+        if code_says_in:
+            self.in_codes += 1
+        else:
+            self.out_codes += 1
+
+        if last is not None and log_time - last[0] <= self.debounce:
+            return None
+        if self.punch_codes_reliable():
+            return "in" if code_says_in else "out"
+        return super().classify(employee_id, log_time, punch, last)
+
+class BoundedWindowStrategy:
+    """Only classifies punches between `start` and `end`, delegating to `inner`."""
+
+    name = "window"
+
+    def __init__(self, inner, start, end):
+        self.inner = inner
+        self.start = start
+        self.end = end
+
+    def prepare(self, settings, state_dir="."):
+        self.inner.prepare(settings, state_dir)
+
+    def save(self, state_dir="."):
+        self.inner.save(state_dir)
+
+    def classify(self, employee_id, log_time, punch, last):
+        if log_time < self.start or log_time > self.end:
+            return None
+        return self.inner.classify(employee_id, log_time, punch, last)
+
+STRATEGIES = {
+    ToggleStrategy.name: ToggleStrategy,
+    ShiftStrategy.name: ShiftStrategy,
+    PunchCodeStrategy.name: PunchCodeStrategy,
+    PunchCodeAwareStrategy.name: PunchCodeAwareStrategy
+}
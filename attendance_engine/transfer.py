@@ -0,0 +1,225 @@
+"""
+Deadline-bound, resumable reads of a device's attendance log.
+
+pyzk's get_attendance() pulls the whole log in one call and throws it away if
+the link drops half way. Here the device's buffered log is read chunk by
+chunk: every chunk is decoded at once, its records are appended to
+transfer_records.jsonl and transfer_checkpoint.txt moves to the end of the
+last whole record. An interrupted read resumes from that offset on the next
+cycle, after checking that the bytes just before it are still the ones that
+were read (the device log was not cleared or rewritten in between).
+"""
+import os
+import json
+import time
+import hashlib
+from datetime import datetime
+from struct import pack, unpack
+
+from . import config
+from .profiling import stage
+from .startup import lazy_import
+from .state import TIME_FORMAT, write_file_atomic
+
+TRANSFER_CHECKPOINT_FILE = "transfer_checkpoint.txt"
+TRANSFER_RECORDS_FILE = "transfer_records.jsonl"
+TAIL_BYTES = 64 # Bytes before the resume offset compared against the checkpoint.
+
+class DeviceReadTimeout(TimeoutError):
+    """Raised when a device read runs past DEVICE_READ_DEADLINE."""
+
+def connect_device(settings):
+    """Connects to the device with a socket timeout of DEVICE_TIMEOUT seconds per request."""
+    ZK = lazy_import("zk").ZK
+    return ZK(settings["device_ip"], port=settings["device_port"], timeout=config.DEVICE_TIMEOUT).connect()
+
+def tail_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def load_transfer_checkpoint(state_dir="."):
+    """Returns the saved checkpoint dict, or None when no read was interrupted."""
+    try:
+        with open(os.path.join(state_dir, TRANSFER_CHECKPOINT_FILE), "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def load_checkpointed_records(checkpoint, state_dir="."):
+    """Reads back the records decoded before the checkpoint; anything written after it is dropped."""
+    Attendance = lazy_import("zk.attendance").Attendance
+    records = []
+    with open(os.path.join(state_dir, TRANSFER_RECORDS_FILE), "r+") as file:
+        while len(records) < checkpoint["records"]:
+            line = file.readline()
+            if not line.endswith("\n"):
+                raise ValueError("checkpointed records are incomplete")
+            user_id, log_time, status, punch, uid = json.loads(line)
+            records.append(Attendance(user_id, datetime.strptime(log_time, TIME_FORMAT), status, punch, uid))
+        # Drop records written after the last checkpoint so new ones append in place.
+        file.truncate(file.tell())
+    return records
+
+def clear_transfer_checkpoint(state_dir="."):
+    for name in (TRANSFER_CHECKPOINT_FILE, TRANSFER_RECORDS_FILE):
+        try:
+            os.remove(os.path.join(state_dir, name))
+        except FileNotFoundError:
+            pass
+
+def record_decoder(conn, record_size, users=None):
+    """Returns a function decoding one raw record into an Attendance, following pyzk's layouts."""
+    Attendance = lazy_import("zk.attendance").Attendance
+    decode_time = conn._ZK__decode_time
+
+    if record_size == 8:
+        user_ids = {user.uid: user.user_id for user in users}
+        def decode(raw):
+            uid, status, timestamp, punch = unpack('HB4sB', raw)
+            return Attendance(user_ids.get(uid, str(uid)), decode_time(timestamp), status, punch, uid)
+        return decode
+
+    if record_size == 16:
+        by_user_id = {user.user_id: user for user in users}
+        by_uid = {user.uid: user for user in users}
+        def decode(raw):
+            user_id, timestamp, status, punch, _reserved, _workcode = unpack('<I4sBB2sI', raw)
+            user = by_user_id.get(str(user_id)) or by_uid.get(user_id)
+            if user is None:
+                return Attendance(str(user_id), decode_time(timestamp), status, punch, str(user_id))
+            return Attendance(user.user_id, decode_time(timestamp), status, punch, user.uid)
+        return decode
+
+    def decode(raw):
+        uid, user_id, status, timestamp, punch, _space = unpack('<H24sB4sB8s', raw)
+        user_id = user_id.split(b'\x00')[0].decode(errors='ignore')
+        return Attendance(user_id, decode_time(timestamp), status, punch, uid)
+    return decode
+
+def prepare_attendance_buffer(conn):
+    """
+    Asks the device to buffer its attendance log. Returns (buffer size, None),
+    or (None, data) when the log is small enough to come back in the reply itself.
+    """
+    const = lazy_import("zk.const")
+    response = conn._ZK__send_command(1503, pack('<bhii', 1, const.CMD_ATTLOG_RRQ, 0, 0), 1024)
+    if not response.get('status'):
+        raise lazy_import("zk.exception").ZKErrorResponse("RWB Not supported")
+    if response['code'] == const.CMD_DATA:
+        data = conn._ZK__data
+        if conn.tcp and len(data) < conn._ZK__tcp_length - 8:
+            # The rest of the reply is still on the socket, as in pyzk's read_with_buffer().
+            data += conn._ZK__recieve_raw_data(conn._ZK__tcp_length - 8 - len(data))
+        return None, data
+    return unpack('I', conn._ZK__data[1:5])[0], None
+
+def decode_inline_attendance(conn, data, users=None):
+    """Decodes a log that came back in the reply to prepare_attendance_buffer()."""
+    if len(data) < 4:
+        return []
+    record_size = unpack('I', data[:4])[0] // conn.records
+    if record_size not in (8, 16):
+        record_size = 40
+    if record_size != 40 and not users:
+        users = conn.get_users()
+    decode = record_decoder(conn, record_size, users)
+    end = 4 + (len(data) - 4) // record_size * record_size
+    with stage("decode"):
+        return [decode(data[i:i + record_size]) for i in range(4, end, record_size)]
+
+def read_attendance(conn, settings, state_dir=".", deadline=None, users=None):
+    """
+    Reads every attendance record from a connected device, resuming an
+    interrupted read where possible. Raises DeviceReadTimeout once `deadline`
+    (a time.monotonic() value) has passed; the records read so far stay
+    checkpointed for the next attempt. `users` (a cached roster) saves the
+    user download the short record formats need.
+    """
+    deadline = deadline or time.monotonic() + config.DEVICE_READ_DEADLINE
+    started = time.monotonic()
+
+    conn.read_sizes()
+    if conn.records == 0:
+        clear_transfer_checkpoint(state_dir)
+        return []
+    size, inline = prepare_attendance_buffer(conn)
+    if size is None:
+        # Small logs come back in a single reply; there is nothing to resume.
+        clear_transfer_checkpoint(state_dir)
+        return decode_inline_attendance(conn, inline, users)
+    max_chunk = 0xFFc0 if conn.tcp else 16 * 1024
+
+    try:
+        records, offset, record_size, tail = resume_transfer(conn, settings, size, state_dir)
+        resumed_bytes = offset
+        if record_size is None:
+            record_size = unpack('I', conn._ZK__read_chunk(0, 4)[:4])[0] // conn.records
+            if record_size not in (8, 16):
+                record_size = 40
+            offset = 4
+        if record_size != 40 and not users:
+            # The short record formats only carry the device uid; reading the
+            # user list replaces the device buffer, so it is prepared again.
+            conn.free_data()
+            users = conn.get_users()
+            size = prepare_attendance_buffer(conn)[0] or size
+        decode = record_decoder(conn, record_size, users)
+
+        while size - offset >= record_size:
+            if time.monotonic() > deadline:
+                raise DeviceReadTimeout(f"device read deadline passed after {offset} of {size} bytes; will resume next cycle")
+            chunk = conn._ZK__read_chunk(offset, min(max_chunk, size - offset))
+            end = len(chunk) // record_size * record_size
+            checkpointed = len(records)
+            with stage("decode"):
+                records.extend(decode(chunk[i:i + record_size]) for i in range(0, end, record_size))
+            offset += end
+            tail = (tail + chunk[:end])[-TAIL_BYTES:]
+            save_transfer_checkpoint(settings, records, checkpointed, offset, record_size, tail, state_dir)
+    finally:
+        conn.free_data()
+
+    elapsed = time.monotonic() - started
+    transferred = offset - resumed_bytes
+    print(f"Read {len(records)} records from {settings['device_name']}: {transferred / 1024:.1f} KB in {elapsed:.1f}s "
+          f"({transferred / 1024 / max(elapsed, 1e-6):.1f} KB/s)" + (f", resumed at byte {resumed_bytes}." if resumed_bytes else "."))
+    clear_transfer_checkpoint(state_dir)
+    return records
+
+def resume_transfer(conn, settings, size, state_dir="."):
+    """
+    Returns (records, offset, record_size, tail bytes) of an interrupted read
+    that can be continued, or ([], 0, None, b"") to start over.
+    """
+    checkpoint = load_transfer_checkpoint(state_dir)
+    if not checkpoint:
+        return [], 0, None, b""
+    offset = checkpoint["offset"]
+    if checkpoint["device"] != config.device_key(settings) or offset > size or offset < TAIL_BYTES + 4:
+        clear_transfer_checkpoint(state_dir)
+        return [], 0, None, b""
+    try:
+        tail = conn._ZK__read_chunk(offset - TAIL_BYTES, TAIL_BYTES)
+        if tail_digest(tail) != checkpoint["tail"]:
+            raise ValueError("device log changed since the checkpoint")
+        records = load_checkpointed_records(checkpoint, state_dir)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"Discarding the interrupted device read: {e}.")
+        clear_transfer_checkpoint(state_dir)
+        return [], 0, None, b""
+    return records, offset, checkpoint["record_size"], tail
+
+def save_transfer_checkpoint(settings, records, checkpointed, offset, record_size, tail, state_dir="."):
+    """Appends the newly decoded records and fsyncs them before moving the checkpoint."""
+    mode = "a" if checkpointed else "w"
+    with open(os.path.join(state_dir, TRANSFER_RECORDS_FILE), mode) as file:
+        for log in records[checkpointed:]:
+            file.write(json.dumps([log.user_id, log.timestamp.strftime(TIME_FORMAT), log.status, log.punch, log.uid]) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    write_file_atomic(os.path.join(state_dir, TRANSFER_CHECKPOINT_FILE), json.dumps({
+        "device": config.device_key(settings),
+        "offset": offset,
+        "record_size": record_size,
+        "records": len(records),
+        "tail": tail_digest(tail)
+    }))
@@ -0,0 +1,5 @@
+from attendance_engine.reports import main
+
+if __name__ == "__main__":
+    # Example: python3 attendance_report.py --start 2025-10-01 --end 2025-10-31 --docx summary.docx
+    main()
@@ -0,0 +1,7 @@
+from datetime import datetime
+
+from attendance_engine.node import main
+
+if __name__ == "__main__":
+    # Specify the start date (in yyyy-mm-dd format) from which logs should be saved to the database.
+    main(default_start_date=datetime(2025, 5, 1))
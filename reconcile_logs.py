@@ -0,0 +1,5 @@
+from attendance_engine.reconcile import main
+
+if __name__ == "__main__":
+    # Example: python3 reconcile_logs.py --start 2025-05-01 --end 2025-05-31 --strategy shift
+    main()
@@ -0,0 +1,4 @@
+from attendance_engine.rotation import main
+
+if __name__ == "__main__":
+    main()
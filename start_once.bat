@@ -0,0 +1,3 @@
+@echo off
+cd C:\Users\service dept\Downloads\HRMS\attendance-logs-script-main\attendance-logs-script-main
+"C:\Users\service dept\AppData\Local\Microsoft\WindowsApps\python3.exe" attendance_logs.py --once
\ No newline at end of file
@@ -0,0 +1,39 @@
+from collections import namedtuple
+from datetime import datetime
+
+from attendance_engine.archive import archive_logs, archive_covers, iter_archived_logs, load_archive_cursor
+
+Attendance = namedtuple("Attendance", ["user_id", "timestamp", "status", "punch", "uid"])
+
+def punch(user_id, time):
+    return Attendance(user_id, datetime.strptime(f"2026-10-19 {time}", "%Y-%m-%d %H:%M:%S"), 1, 0, int(user_id))
+
+def archived(archive_dir):
+    start, end = datetime(2026, 10, 19), datetime(2026, 10, 19, 23, 59, 59)
+    return sorted((log.user_id, log.timestamp.strftime("%H:%M:%S")) for log in iter_archived_logs(start, end, archive_dir))
+
+def test_punches_after_the_device_clock_was_set_back_are_archived(tmp_path):
+    archive_dir = str(tmp_path)
+    device = [punch("1", "10:00:00"), punch("2", "10:05:00")]
+    assert archive_logs(device, archive_dir) == 2
+
+    # The clock is set back an hour; the next punches are stamped before the cursor.
+    device.append(punch("3", "09:10:00"))
+    assert archive_logs(device, archive_dir) == 1
+    device.append(punch("4", "09:15:00"))
+    assert archive_logs(device, archive_dir) == 1
+    assert archive_logs(device, archive_dir) == 0
+
+    assert archived(archive_dir) == [("1", "10:00:00"), ("2", "10:05:00"), ("3", "09:10:00"), ("4", "09:15:00")]
+    assert load_archive_cursor(archive_dir)[0] == datetime(2026, 10, 19, 10, 5)
+    assert archive_covers(datetime(2026, 10, 19, 9), datetime(2026, 10, 19, 10), archive_dir)
+
+def test_cleared_device_log_is_archived_by_time(tmp_path):
+    archive_dir = str(tmp_path)
+    assert archive_logs([punch("1", "10:00:00"), punch("2", "10:05:00"), punch("3", "10:06:00")], archive_dir) == 3
+
+    # After a rotation the device holds fewer records than the cursor remembers.
+    assert archive_logs([punch("4", "11:00:00")], archive_dir) == 1
+    assert archive_logs([punch("4", "11:00:00"), punch("5", "11:30:00")], archive_dir) == 1
+
+    assert [user_id for user_id, _ in archived(archive_dir)] == ["1", "2", "3", "4", "5"]
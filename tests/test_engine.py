@@ -0,0 +1,64 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from attendance_engine import config, engine
+from attendance_engine.strategies import ToggleStrategy
+
+Attendance = namedtuple("Attendance", ["user_id", "timestamp", "status", "punch", "uid"])
+
+class HostClock(datetime):
+    """Stands in for engine.datetime so the test decides what "now" is."""
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+def make_settings(archive_dir, start_date):
+    return {
+        "device_ip": "10.0.0.2",
+        "device_port": 4370,
+        "device_name": "Test",
+        "device_tz": None,
+        "branch_id": "b1",
+        "company_id": "c1",
+        "api_url": "http://api.invalid/logs",
+        "relay_url": None,
+        "summary_api_url": None,
+        "employee_map_file": None,
+        "debounce_seconds": 30,
+        "punch_code_mode": "auto",
+        "archive_dir": archive_dir,
+        "start_date": start_date,
+    }
+
+def test_punch_recorded_during_the_read_is_sent_next_cycle(tmp_path, monkeypatch):
+    cycle_start = datetime(2026, 10, 19, 9, 0, 0)
+    device = [Attendance("1", cycle_start - timedelta(minutes=5), 1, 0, 1)]
+    sent = []
+
+    def read_device_logs(settings, state_dir, roster=None, clock=None):
+        logs = list(device)
+        if len(sent) == 0:
+            # The transfer takes 20 s; employee 2 punches 10 s into it, after the records were sent over.
+            device.append(Attendance("2", cycle_start + timedelta(seconds=10), 1, 0, 2))
+            HostClock.current = cycle_start + timedelta(seconds=20)
+        return logs
+
+    def send_logs_to_api(logs, api_url, lane=None, breaker=None):
+        sent.append([(entry["employee_id"], entry["check_time"]) for entry in logs])
+        return True
+
+    monkeypatch.setattr(engine, "datetime", HostClock)
+    monkeypatch.setattr(engine, "read_device_logs", read_device_logs)
+    monkeypatch.setattr(engine, "send_logs_to_api", send_logs_to_api)
+    monkeypatch.setattr(config, "ARCHIVE_LOGS", False)
+    settings = make_settings(str(tmp_path / "archive"), cycle_start - timedelta(days=1))
+    strategy = ToggleStrategy()
+
+    HostClock.current = cycle_start
+    engine.fetch_and_process_logs(strategy, settings, str(tmp_path))
+    HostClock.current = cycle_start + timedelta(minutes=1)
+    engine.fetch_and_process_logs(strategy, settings, str(tmp_path))
+
+    assert sent == [[("1", "08:55:00")], [("2", "09:00:10")]]
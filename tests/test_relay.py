@@ -0,0 +1,33 @@
+from attendance_engine import relay as relay_module
+from attendance_engine.relay import Relay
+
+def make_entry(**fields):
+    entry = {
+        "employee_id": "42",
+        "company_id": "c1",
+        "branch_id": "b1",
+        "check_date": "2026-10-19",
+        "check_time": "09:00:00",
+        "checklog": "in",
+        "device_name": "Test",
+    }
+    entry.update(fields)
+    return entry
+
+def test_dead_lettered_entry_is_accepted_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(relay_module, "RELAY_DEAD_LETTER_FILE", str(tmp_path / "dead_letter.jsonl"))
+    relay = Relay("http://api.invalid/logs", str(tmp_path / "journal"))
+    entry = make_entry()
+
+    assert relay.accept([entry], "live") == 1
+    assert relay.accept([entry], "live") == 0
+    relay.dead_letter("live", [entry], 422, "invalid employee")
+    assert relay.accept([make_entry()], "live") == 1
+    assert (tmp_path / "dead_letter.jsonl").read_text().count("invalid employee") == 1
+
+def test_corrected_checklog_is_not_a_duplicate(tmp_path):
+    relay = Relay("http://api.invalid/logs", str(tmp_path / "journal"))
+
+    assert relay.accept([make_entry(checklog="in")], "catchup") == 1
+    assert relay.accept([make_entry(checklog="out")], "catchup") == 1
+    assert relay.accept([make_entry(checklog="out")], "catchup") == 0
@@ -0,0 +1,63 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from attendance_engine.clock import DeviceClock
+from attendance_engine.rotation import check_rotation_safe
+from attendance_engine.state import save_last_processed_time
+
+Attendance = namedtuple("Attendance", ["user_id", "timestamp", "status", "punch", "uid"])
+
+class FakeConn:
+    """Answers get_time() with a device clock running `offset` away from the host."""
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def get_time(self):
+        return datetime.now().replace(microsecond=0) + self.offset
+
+def measured_clock(state_dir, offset):
+    clock = DeviceClock({"device_name": "Test", "device_tz": None}, str(state_dir))
+    clock.measure(FakeConn(offset))
+    return clock
+
+def test_unsent_punches_of_a_slow_device_are_not_acknowledged(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    behind = timedelta(minutes=10)
+    save_last_processed_time(now - timedelta(minutes=1), str(tmp_path))
+    # Punched 30 s ago on the host's clock, so not sent yet; the device stamped it 10 minutes earlier.
+    attendance_logs = [
+        Attendance("1", now - timedelta(hours=2) - behind, 1, 0, 1),
+        Attendance("2", now - timedelta(seconds=30) - behind, 1, 0, 2),
+    ]
+
+    clock = measured_clock(tmp_path, -behind)
+    safe, reason, details = check_rotation_safe(attendance_logs, str(tmp_path / "archive"), clock, str(tmp_path))
+
+    assert not safe
+    assert "behind" in reason
+    assert abs(details["clock_skew"] + 600) < 5
+
+def test_acknowledged_punches_of_an_accurate_device_can_be_rotated(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    save_last_processed_time(now - timedelta(minutes=1), str(tmp_path))
+    attendance_logs = [
+        Attendance("1", now - timedelta(hours=2), 1, 0, 1),
+        Attendance("2", now - timedelta(minutes=5), 1, 0, 2),
+    ]
+
+    clock = measured_clock(tmp_path, timedelta(0))
+    safe, reason, _ = check_rotation_safe(attendance_logs, str(tmp_path / "archive"), clock, str(tmp_path))
+
+    assert safe, reason
+
+def test_recent_punch_of_an_accurate_device_is_not_acknowledged(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    save_last_processed_time(now - timedelta(minutes=1), str(tmp_path))
+    attendance_logs = [Attendance("1", now - timedelta(seconds=30), 1, 0, 1)]
+
+    clock = measured_clock(tmp_path, timedelta(0))
+    safe, reason, _ = check_rotation_safe(attendance_logs, str(tmp_path / "archive"), clock, str(tmp_path))
+
+    assert not safe
+    assert "acknowledged" in reason